@@ -0,0 +1,149 @@
+"""
+Admission control for the /offer route.
+
+Negotiations hold a coroutine for up to the ICE gathering timeout, so an
+unbounded burst of offers slows every call down. AdmissionController caps
+in-flight negotiations and established peers, lets a few requests wait in a
+short queue, and rejects the rest immediately with a Retry-After hint,
+before any RTCPeerConnection is allocated.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class Rejected(Exception):
+    """
+    The request was not admitted. `status` is the HTTP status to answer
+    with and `retry_after` the suggested back-off in seconds.
+    """
+
+    def __init__(self, reason, status=503, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take one token; returns 0 on success or the seconds until one is
+        available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight=8,
+        max_peers=200,
+        queue_size=16,
+        queue_timeout=2.0,
+        rate_per_ip=1.0,
+        burst_per_ip=5,
+        peer_count=lambda: 0,
+        rate_exempt=(),
+    ):
+        self.max_inflight = max_inflight
+        self.max_peers = max_peers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.rate_per_ip = rate_per_ip
+        self.burst_per_ip = burst_per_ip
+        self.peer_count = peer_count
+        self.rate_exempt = set(rate_exempt)
+
+        self.inflight = 0
+        self.waiting = 0
+        self._released = asyncio.Condition()
+        self._buckets = {}
+
+        # metrics
+        self.admitted = 0
+        self.rejected = {}
+
+    def _reject(self, reason, status=503, retry_after=1):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise Rejected(reason, status, max(1, int(round(retry_after))))
+
+    def _check_rate(self, client):
+        if client in self.rate_exempt:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                self._prune()
+            bucket = self._buckets[client] = TokenBucket(self.rate_per_ip, self.burst_per_ip)
+        wait = bucket.take()
+        if wait:
+            self._reject("rate_limited", status=429, retry_after=wait)
+
+    def _prune(self):
+        # a bucket that has refilled completely carries no state
+        now = time.monotonic()
+        full = self.burst_per_ip / self.rate_per_ip
+        self._buckets = {ip: b for ip, b in self._buckets.items() if now - b.updated < full}
+
+    def _has_capacity(self):
+        # peer_count() already includes peers still negotiating
+        return self.inflight < self.max_inflight and self.peer_count() < self.max_peers
+
+    async def _acquire(self):
+        if self.peer_count() >= self.max_peers:
+            self._reject("max_peers", retry_after=30)
+        if self._has_capacity():
+            self.inflight += 1
+            return
+        if self.waiting >= self.queue_size:
+            self._reject("queue_full", retry_after=self.queue_timeout)
+
+        self.waiting += 1
+        try:
+            async with self._released:
+                await asyncio.wait_for(self._released.wait_for(self._has_capacity), self.queue_timeout)
+                self.inflight += 1
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout", retry_after=self.queue_timeout)
+        finally:
+            self.waiting -= 1
+
+    async def _release(self):
+        self.inflight -= 1
+        async with self._released:
+            self._released.notify()
+
+    @asynccontextmanager
+    async def negotiation(self, client):
+        """
+        Hold one negotiation slot for `client` (the remote address), or
+        raise Rejected.
+        """
+        self._check_rate(client)
+        await self._acquire()
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            await self._release()
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
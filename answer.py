@@ -1,38 +1,117 @@
 import asyncio
+import math
 import subprocess
+import time
 from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
-from aiortc.contrib.media import MediaPlayer, MediaStreamTrack, MediaRecorder
+from aiortc.contrib.media import MediaPlayer, MediaStreamTrack, MediaBlackhole
 import aiohttp_cors
 
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from peer_registry import PeerRegistry
+from admission import AdmissionController, Rejected
+from ice_restart import IceRestart
+from opus_recorder import recorder_for
+from pubsub import PubSub
+
+# How this server wants to receive Opus; senders are capped by it too.
+OPUS_SETTINGS = VOICE
+install_encoder_hook(OPUS_SETTINGS)
+
+# Every live peer; closed when idle, too old, disconnected or on shutdown.
+peers = PeerRegistry(idle_timeout=60.0, max_duration=4 * 3600.0, disconnect_grace=10.0)
+
+# Bounded negotiations and peers; overload is answered with 503 + Retry-After.
+# Loopback skips the per-IP rate limit so local load tests are not throttled
+# (behind a reverse proxy on this host every client is loopback: clear it).
+admission = AdmissionController(
+    max_inflight=8,
+    max_peers=200,
+    queue_size=16,
+    queue_timeout=2.0,
+    peer_count=lambda: len(peers),
+    rate_exempt={"127.0.0.1", "::1"},
+)
+
+# .ogg/.webm keep the received Opus packets as is; .wav decodes every packet.
+RECORDING = "received1.ogg"
+
+# Minimum seconds between ICE restarts of one session; each one gathers
+# new sockets and sends STUN.
+RESTART_INTERVAL = 5.0
+
+# Topics peers join and publish to over their "chat" data channel.
+rooms = PubSub(max_topics=1000, max_queue=256)
+
+# Set to a file to measure mouth-to-ear latency of `rtc.py tone --latency`;
+# received audio is then decoded for the probe instead of recorded.
+LATENCY_RESULTS = None
+
 
 async def offer(request):
+    try:
+        async with admission.negotiation(request.remote):
+            return await negotiate(request)
+    except Rejected as e:
+        return web.Response(status=e.status, headers={"Retry-After": str(e.retry_after)}, text=f"Server busy: {e.reason}")
+
+
+async def negotiate(request):
+
+    # Parse the offer before allocating anything for it
+    try:
+        data = await request.json()  # Asynchronously read the JSON data
+        offer_sdp = data.get("offer")  # Extract 'offer' from the JSON
+    except Exception as e:
+        return web.Response(status=400, text="Invalid JSON data: " + str(e))
+    if not isinstance(offer_sdp, str) or not offer_sdp.startswith("v=0"):
+        return web.Response(status=400, text="Missing or invalid offer SDP")
+    if not any(line.startswith("m=") for line in offer_sdp.splitlines()):
+        return web.Response(status=400, text="Offer SDP has no media section")
 
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
 
 
-    recorder = MediaRecorder("received1.wav")  # or "output.wav" if playback not supported
+    recorder = recorder_for(RECORDING, pc)
+    session = peers.add(pc, recorder, label=request.remote)
  
     # 🎧 STEP 2 — When a track is received
     @pc.on("track")
     async def on_track(track):
         print(f"📡 Received {track.kind} track")
 
-        if track.kind == "audio":
+        # whatever reads this track: the latency probe, the recorder or a sink
+        consumer = None
+        if track.kind == "audio" and LATENCY_RESULTS:
+            # imported here: numpy stays out of the server's startup
+            from latency_probe import LatencyProbe
+
+            consumer = LatencyProbe(LATENCY_RESULTS, label=f"peer {session.id}")
+            consumer.addTrack(track)
+            await consumer.start()
+        elif track.kind == "audio":
             # Connect incoming audio to recorder
+            consumer = recorder
             recorder.addTrack(track)
             await recorder.start()
             print("🎵 Audio playback started")
             subprocess.Popen(["ffplay", "-nodisp", "-autoexit", "received.wav"])
+        elif track.kind == "video":
+            # decoded and dropped: exercises the video path without storing it
+            consumer = MediaBlackhole()
+            consumer.addTrack(track)
+            await consumer.start()
 
         @track.on("ended")
         async def on_ended():
-            print("Audio track ended")
-            await recorder.stop()
+            print(f"{track.kind.capitalize()} track ended")
+            if consumer is not None:
+                await consumer.stop()
 
     @pc.on("datachannel")
     def on_datachannel_b(channel):
         print(f"data channel opened by remote peer with label: {channel.label}")
+        subscriber = rooms.subscriber(channel, session.id) if channel.label == "chat" else None
         
         @channel.on("open")
         def on_open_b():
@@ -41,17 +120,19 @@ async def offer(request):
 
         @channel.on("message")
         def on_message_b(message):
+            session.touch()
+            if subscriber is not None and rooms.handle(subscriber, message):
+                return
             print(f"Peer B received: {message}")
             channel.send("Thanks for the message!")
 
     # Set remote description
     try:
-        data = await request.json()  # Asynchronously read the JSON data
-        offer_sdp = data.get("offer")  # Extract 'offer' from the JSON
         print("\n\n\nOffer SDP,\n", offer_sdp)
         await pc.setRemoteDescription(RTCSessionDescription(offer_sdp, "offer"))
     except Exception as e:
-        return web.Response(status=400, text="Invalid JSON data: " + str(e))
+        await peers.close(session, "bad_offer")
+        return web.Response(status=400, text="Invalid offer SDP: " + str(e))
     
     
     # Use an event listener to wait for ICE gathering to complete
@@ -73,9 +154,74 @@ async def offer(request):
 
     print("\n\n\nAnswer SDP,\n",pc.localDescription.sdp)
 
-    return web.Response(text=pc.localDescription.sdp)
+    # The token lets the client renegotiate the transport later (/restart)
+    return web.Response(
+        text=apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS),
+        headers={"X-Session-Token": session.token},
+    )
+
+
+async def restart(request):
+    """
+    ICE restart: swap new ICE credentials and candidates for an existing
+    session without touching its tracks, data channels or recorder.
+    """
+    try:
+        data = await request.json()
+        session = peers.by_token(str(data["session"]))
+        remote_ice = data["ice"]
+    except Exception as e:
+        return web.Response(status=400, text="Invalid JSON data: " + str(e))
+    if session is None:
+        return web.Response(status=404, text="Unknown session")
+    if session.restart_task is not None and not session.restart_task.done():
+        return web.Response(status=409, text="ICE restart already in progress")
+    now = time.monotonic()
+    if session.last_restart is not None and now - session.last_restart < RESTART_INTERVAL:
+        retry_after = math.ceil(session.last_restart + RESTART_INTERVAL - now)
+        return web.Response(status=429, headers={"Retry-After": str(retry_after)}, text="ICE restart too soon")
+    session.last_restart = now
+
+    try:
+        ice_restart = await IceRestart.create(session.pc)
+    except Exception as e:
+        print(f"Peer {session.id}: ICE restart failed to gather: {e}")
+        return web.Response(status=503, headers={"Retry-After": str(int(RESTART_INTERVAL))}, text="ICE restart failed")
+
+    async def complete():
+        try:
+            elapsed = await ice_restart.complete(remote_ice)
+            print(f"Peer {session.id}: ICE restarted in {elapsed:.2f}s")
+            session.touch()
+        except Exception as e:
+            print(f"Peer {session.id}: ICE restart failed: {e}")
+
+    def closed_unless_completed(task):
+        # also covers a task cancelled before it ever ran
+        if not ice_restart.completed:
+            asyncio.ensure_future(ice_restart.close())
+
+    async with ice_restart:
+        parameters = ice_restart.local_parameters()
+        # checks run while the client receives our parameters; closing the
+        # session cancels them
+        session.restart_task = asyncio.ensure_future(complete())
+        session.restart_task.add_done_callback(closed_unless_completed)
+    return web.json_response({"ice": parameters})
+
+
+async def stats(request):
+    return web.json_response({
+        **peers.gauges(),
+        "admission": admission.stats(),
+        "topics": rooms.stats(),
+        "ended_topics": dict(rooms.ended),
+        "sessions": [session.info() for session in peers.sessions.values()],
+    })
 
 app = web.Application()
+app.on_startup.append(peers.on_startup)
+app.on_shutdown.append(peers.on_shutdown)
 
 cors = aiohttp_cors.setup(app, defaults={
     "*": aiohttp_cors.ResourceOptions(
@@ -87,6 +233,8 @@ cors = aiohttp_cors.setup(app, defaults={
 
 # Add your offer route
 app.router.add_post("/offer", offer)
+app.router.add_post("/restart", restart)
+app.router.add_get("/stats", stats)
 
 # Enable CORS for all routes
 for route in list(app.router.routes()):
@@ -0,0 +1,145 @@
+"""
+Data-channel pub/sub fan-out: throughput, latency and the slow-consumer policy.
+
+Starts `--peers` subscriber peer connections and a server side running
+pubsub.PubSub in this process, all joined to one topic. Peer 1 publishes
+`--rate` messages per second of `--size` bytes. The last peer reaches the
+server through an ImpairmentProxy capped at `--slow-kbps`, so it cannot
+keep up: its queue fills and drops the oldest messages while the others
+are unaffected. Prints and saves per-peer delivery and latency (from the
+server's `ts`) and the topic stats.
+
+usage: python benchmarks/fanout.py [--peers N] [--rate R] [--size B] [--duration S] [--slow-kbps K]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+from impairment import ImpairmentProxy, LinkProfile
+from pubsub import PubSub
+
+TOPIC = "bench"
+
+
+async def connect(rooms, peer_id, proxy=None):
+    """
+    A client and its server-side peer; returns (client pc, server pc, chat
+    channel, received (seq, latency) list).
+    """
+    client = RTCPeerConnection()
+    server = RTCPeerConnection()
+    channel = client.createDataChannel("chat")
+    received = []
+
+    @server.on("datachannel")
+    def on_datachannel(remote):
+        subscriber = rooms.subscriber(remote, peer_id)
+
+        @remote.on("message")
+        def on_message(message):
+            rooms.handle(subscriber, message)
+
+    @channel.on("message")
+    def on_message(message):
+        message = json.loads(message)
+        if message["op"] == "message":
+            received.append((message["seq"], time.time() - message["ts"]))
+
+    opened = asyncio.Event()
+    channel.on("open", opened.set)
+
+    await client.setLocalDescription(await client.createOffer())
+    offer = client.localDescription.sdp
+    if proxy is not None:
+        offer = await proxy.offer(offer)
+    await server.setRemoteDescription(RTCSessionDescription(offer, "offer"))
+    await server.setLocalDescription(await server.createAnswer())
+    answer = server.localDescription.sdp
+    if proxy is not None:
+        answer = proxy.answer(answer)
+    await client.setRemoteDescription(RTCSessionDescription(answer, "answer"))
+    await asyncio.wait_for(opened.wait(), 15)
+    return client, server, channel, received
+
+
+def peer_stats(received, published):
+    seqs = {seq for seq, _ in received}
+    stats = {"received": len(seqs), "missing": published - len(seqs)}
+    if received:
+        ms = np.array([latency for _, latency in received]) * 1000
+        stats["p50_ms"] = round(float(np.percentile(ms, 50)), 1)
+        stats["p95_ms"] = round(float(np.percentile(ms, 95)), 1)
+        stats["max_ms"] = round(float(ms.max()), 1)
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=50.0)
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--slow-kbps", type=int, default=64)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--high-water", type=int, default=16 * 1024)
+    parser.add_argument("--output", default="fanout_results.json")
+    options = parser.parse_args()
+
+    rooms = PubSub(max_queue=options.max_queue, high_water=options.high_water)
+    # messages flow server to client: the backward direction
+    proxy = ImpairmentProxy(LinkProfile(), LinkProfile(rate_kbps=options.slow_kbps, queue_ms=2000))
+    peers = []
+    for peer_id in range(1, options.peers + 1):
+        slow = peer_id == options.peers
+        peers.append(await connect(rooms, peer_id, proxy if slow else None))
+        # the server-side subscriber exists once its datachannel event has run
+        peers[-1][2].send(json.dumps({"op": "join", "topic": TOPIC}))
+    await asyncio.sleep(0.5)
+    print(f"{options.peers} peers joined {TOPIC!r}; peer {options.peers} is capped at {options.slow_kbps} kbps")
+
+    publisher = peers[0][2]
+    payload = "x" * options.size
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    published = 0
+    while loop.time() - start < options.duration:
+        publisher.send(json.dumps({"op": "publish", "topic": TOPIC, "data": payload}))
+        published += 1
+        await asyncio.sleep(max(0.0, start + published / options.rate - loop.time()))
+    await asyncio.sleep(1.0)  # let the fast peers catch up
+
+    # the topic ends with its last subscriber; its final stats stay in rooms.ended
+    for client, server, _, _ in peers:
+        await client.close()
+        await server.close()
+    proxy.close()
+
+    topic = rooms.topic_stats(TOPIC)
+    results = {
+        "options": vars(options),
+        "published": published,
+        "topic": topic,
+        "peers": {peer_id: peer_stats(received, published) for peer_id, (_, _, _, received) in enumerate(peers[1:], 2)},
+    }
+    print(f"{'peer':>5} {'received':>9} {'missing':>8} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7}")
+    for peer_id, stats in results["peers"].items():
+        print(
+            f"{peer_id:>5} {stats['received']:>9} {stats['missing']:>8} {stats.get('p50_ms', float('nan')):>7.1f} "
+            f"{stats.get('p95_ms', float('nan')):>7.1f} {stats.get('max_ms', float('nan')):>7.1f}"
+        )
+    print(f"\ntopic: {topic}")
+
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {options.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
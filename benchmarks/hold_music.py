@@ -0,0 +1,93 @@
+"""
+CPU per caller for hold music: MediaPlayer vs the media_cache.py tracks.
+
+Runs N tracks of each kind for a few seconds in real time and does what
+aiortc's sender does with their output (encode frames with aiortc's Opus
+encoder, or only pack pre-encoded packets), then prints the process CPU
+time per caller and second of audio.
+
+usage: python benchmarks/hold_music.py [--callers N] [--seconds S] [audio file]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import av
+import numpy as np
+from aiortc.codecs.opus import OpusEncoder
+from aiortc.contrib.media import MediaPlayer
+
+from media_cache import CachedAudioTrack, cache_opus, cache_pcm
+from resample import OPUS_RATE
+
+
+def make_source(seconds=30):
+    """
+    An MP3 of a few chords, standing in for hold music.
+    """
+    path = os.path.join(tempfile.gettempdir(), "hold_music_test.mp3")
+    if os.path.exists(path):
+        return path
+    t = np.arange(seconds * OPUS_RATE) / OPUS_RATE
+    chord = sum(np.sin(2 * np.pi * f * t * (1 + 0.5 * (np.floor(t / 2) % 2))) for f in (220, 277, 330))
+    pcm = np.int16(chord / 3 * 0.3 * 32767)
+    with av.open(path, "w") as container:
+        stream = container.add_stream("libmp3lame", rate=OPUS_RATE, layout="stereo")
+        for start in range(0, len(pcm), 1152):
+            block = np.repeat(pcm[start:start + 1152], 2).reshape(1, -1)
+            frame = av.AudioFrame.from_ndarray(block, format="s16", layout="stereo")
+            frame.sample_rate = OPUS_RATE
+            frame.pts = start
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+    return path
+
+
+async def consume(track, deadline):
+    encoder = OpusEncoder()
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        data = await track.recv()
+        if isinstance(data, av.Packet):
+            encoder.pack(data)
+        else:
+            encoder.encode(data)
+
+
+async def measure(name, make_track, callers, seconds):
+    tracks = [make_track() for _ in range(callers)]
+    loop = asyncio.get_running_loop()
+    started_cpu = time.process_time()
+    started = loop.time()
+    await asyncio.gather(*(consume(track, started + seconds) for track in tracks))
+    cpu = time.process_time() - started_cpu
+    wall = loop.time() - started
+    for track in tracks:
+        track.stop()
+    print(f"{name:<22} {cpu / callers / wall * 1000:8.2f} ms CPU per caller-second  ({100 * cpu / wall:.0f}% of a core for {callers})")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", nargs="?")
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    options = parser.parse_args()
+    source = options.source or make_source()
+
+    started = time.perf_counter()
+    cache_pcm(source)
+    cache_opus(source)
+    print(f"cache ready in {time.perf_counter() - started:.2f}s")
+
+    await measure("MediaPlayer", lambda: MediaPlayer(source).audio, options.callers, options.seconds)
+    await measure("cached PCM + encode", lambda: CachedAudioTrack(source, encoded=False), options.callers, options.seconds)
+    await measure("cached Opus", lambda: CachedAudioTrack(source), options.callers, options.seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,201 @@
+"""
+Audio quality and data-channel performance under impaired networks.
+
+For each scenario in impairment.py, two peers in this process call each
+other through an ImpairmentProxy: A sends the speech-like test signal of
+opus_bandwidth.py and a 200-byte data-channel message every 20 ms, B
+records both. Per scenario this prints and saves:
+
+  * audio: share of the stream received, gaps, log-spectral distance to
+    the reference (missing audio counts as silence),
+  * data channel: messages delivered, one-way latency p50/p95/max,
+  * proxy: datagrams lost and dropped in each direction.
+
+DTX is off so every gap in the audio is the network's doing.
+
+usage: python benchmarks/network.py [--duration S] [--seed N] [--output FILE] [scenario ...]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.contrib.media import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+from impairment import ImpairmentProxy, SCENARIOS
+from opus_settings import OpusSettings, apply_to_sdp, install_encoder_hook
+from frame_pool import AudioFramePool
+from resample import OPUS_FRAME, OPUS_RATE
+from opus_bandwidth import test_signal, log_spectral_distance
+
+OPUS_SETTINGS = OpusSettings(max_bitrate=24000, ptime=20, fec=True, dtx=False, stereo=False)
+MESSAGE_SIZE = 200
+MESSAGE_INTERVAL = 0.02
+
+
+class SignalTrack(MediaStreamTrack):
+    """
+    Plays a float signal in real time, looping, as 20 ms int16 frames.
+    """
+
+    kind = "audio"
+
+    def __init__(self, signal):
+        super().__init__()
+        self.pcm = np.int16(np.clip(signal, -1, 1) * 32767)
+        self.pool = AudioFramePool(OPUS_FRAME, OPUS_RATE)
+        self.pts = 0
+        self.start = None
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        loop = asyncio.get_running_loop()
+        if self.start is None:
+            self.start = loop.time()
+        await asyncio.sleep(max(0.0, self.start + self.pts / OPUS_RATE - loop.time()))
+        frame, view = self.pool.acquire(self.pts)
+        offset = self.pts % (len(self.pcm) - OPUS_FRAME)
+        view[:, 0] = self.pcm[offset:offset + OPUS_FRAME]
+        self.pts += OPUS_FRAME
+        return frame
+
+
+async def record(track, frames):
+    """
+    Collect (pts, mono float samples) of every frame B decodes.
+    """
+    while True:
+        try:
+            frame = await track.recv()
+        except MediaStreamError:
+            return
+        samples = frame.to_ndarray().reshape(-1, len(frame.layout.channels))[:, 0]
+        frames.append((frame.pts, samples.astype(np.float32) / 32768))
+
+
+def audio_stats(frames, reference):
+    if not frames:
+        return {"received": 0.0, "gaps": 0, "lsd_db": None}
+    first = frames[0][0]
+    end = frames[-1][0] + len(frames[-1][1]) - first
+    timeline = np.zeros(end, np.float32)
+    covered = 0
+    gaps = 0
+    expected = first
+    for pts, samples in frames:
+        if pts > expected:
+            gaps += 1
+        timeline[pts - first:pts - first + len(samples)] = samples
+        covered += len(samples)
+        expected = pts + len(samples)
+    looped = np.tile(reference, end // len(reference) + 2)
+    return {
+        "received": round(covered / end, 4),
+        "gaps": gaps,
+        "lsd_db": round(log_spectral_distance(looped, timeline), 2),
+    }
+
+
+def latency_stats(sent, latencies):
+    if not latencies:
+        return {"sent": sent, "delivered": 0}
+    ms = np.array(latencies) * 1000
+    return {
+        "sent": sent,
+        "delivered": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+async def run_scenario(scenario, duration, seed, reference):
+    loop = asyncio.get_running_loop()
+    proxy = ImpairmentProxy(seed=seed)
+    a = RTCPeerConnection()
+    b = RTCPeerConnection()
+    a.addTrack(SignalTrack(reference))
+    channel = a.createDataChannel("bench")
+
+    frames = []
+    latencies = []
+    tasks = []
+
+    @b.on("track")
+    def on_track(track):
+        tasks.append(asyncio.ensure_future(record(track, frames)))
+
+    @b.on("datachannel")
+    def on_datachannel(remote):
+        @remote.on("message")
+        def on_message(message):
+            latencies.append(loop.time() - float(message.split(" ", 2)[1]))
+
+    await a.setLocalDescription(await a.createOffer())
+    offer = apply_to_sdp(await proxy.offer(a.localDescription.sdp), OPUS_SETTINGS)
+    await b.setRemoteDescription(RTCSessionDescription(offer, "offer"))
+    await b.setLocalDescription(await b.createAnswer())
+    answer = apply_to_sdp(proxy.answer(b.localDescription.sdp), OPUS_SETTINGS)
+    await a.setRemoteDescription(RTCSessionDescription(answer, "answer"))
+
+    timeline = asyncio.ensure_future(scenario.play(proxy))
+    sent = 0
+    deadline = loop.time() + duration
+    while loop.time() < deadline:
+        if channel.readyState == "open":
+            header = f"{sent} {loop.time():.6f} "
+            channel.send(header + "x" * (MESSAGE_SIZE - len(header)))
+            sent += 1
+        await asyncio.sleep(MESSAGE_INTERVAL)
+
+    timeline.cancel()
+    await a.close()
+    await b.close()
+    for task in tasks:
+        task.cancel()
+    proxy.close()
+
+    return {
+        "scenario": scenario.name,
+        "audio": audio_stats(frames, reference),
+        "datachannel": latency_stats(sent, latencies),
+        "proxy": proxy.stats(),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="network_results.json")
+    options = parser.parse_args()
+
+    install_encoder_hook(OPUS_SETTINGS)
+    reference = test_signal()
+    results = []
+    print(f"{'scenario':<16} {'audio %':>8} {'gaps':>5} {'LSD dB':>7} {'dc %':>6} {'p50 ms':>7} {'p95 ms':>7} {'lost A>B':>9} {'lost B>A':>9}")
+    for name in options.scenarios:
+        result = await run_scenario(SCENARIOS[name], options.duration, options.seed, reference)
+        results.append(result)
+        audio, dc, proxy = result["audio"], result["datachannel"], result["proxy"]
+        delivered = 100 * dc["delivered"] / dc["sent"] if dc["sent"] else 0
+        lost = [proxy[d]["lost"] + proxy[d]["queue_dropped"] for d in ("forward", "backward")]
+        print(
+            f"{name:<16} {100 * audio['received']:>8.1f} {audio['gaps']:>5} {audio['lsd_db'] or float('nan'):>7.1f} "
+            f"{delivered:>6.1f} {dc.get('p50_ms', float('nan')):>7.1f} {dc.get('p95_ms', float('nan')):>7.1f} {lost[0]:>9} {lost[1]:>9}"
+        )
+
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {options.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+"""
+Bandwidth vs quality of the Opus presets in opus_settings.py.
+
+Encodes a test signal with libopus for each preset, decodes it again and
+prints the average bitrate next to SNR and log-spectral distance. Neither is
+a perceptual score (Opus at voice bitrates does not preserve the waveform, so
+SNR is low by design), but both are enough to compare settings against each
+other. DTX-suppressed frames are concealed as silence.
+
+usage: python benchmarks/opus_bandwidth.py [input audio file]
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import av
+import numpy as np
+
+from opus_settings import DtxGate, OpusSettings, VOICE, NARROW_VOICE, MUSIC, configure_codec
+
+SAMPLE_RATE = 48000
+FRAME_SIZE = 960
+DYNAMIC_RANGE_DB = 50  # below each frame's peak, for log_spectral_distance
+
+PRESETS = {
+    "aiortc default": OpusSettings(max_bitrate=96000),
+    "music": MUSIC,
+    "voice": VOICE,
+    "voice, no dtx": OpusSettings(max_bitrate=24000, ptime=20, fec=True, dtx=False, stereo=False),
+    "narrow voice": NARROW_VOICE,
+}
+
+
+def test_signal(seconds=10):
+    """
+    Speech-like test signal: 1 s bursts of a harmonic sweep separated by
+    1 s of near-silence, so DTX has something to do.
+    """
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    f0 = 140 + 60 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    gate = (np.floor(t) % 2 == 0).astype(np.float64)
+    noise = np.random.default_rng(0).normal(0, 0.0001, t.shape)
+    return (0.2 * voiced * gate + noise).astype(np.float32)
+
+
+def load_signal(path):
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray()[0])
+    return np.concatenate(chunks).astype(np.float32)
+
+
+def encode_decode(signal, settings):
+    stereo = bool(settings.stereo)
+    layout = "stereo" if stereo else "mono"
+    encoder = av.CodecContext.create("libopus", "w")
+    encoder.sample_rate = SAMPLE_RATE
+    encoder.layout = layout
+    encoder.format = "s16"
+    configure_codec(encoder, settings)
+
+    decoder = av.CodecContext.create("opus", "r")
+    decoder.sample_rate = SAMPLE_RATE
+    decoder.layout = layout
+
+    pcm = np.int16(np.clip(signal, -1, 1) * 32767)
+    gate = DtxGate() if settings.dtx else None
+    total_bytes = 0
+    packets = 0
+    decoded = []
+    for start in range(0, len(pcm) - FRAME_SIZE + 1, FRAME_SIZE):
+        block = pcm[start:start + FRAME_SIZE]
+        if stereo:
+            block = np.repeat(block, 2)
+        frame = av.AudioFrame.from_ndarray(block.reshape(1, -1), format="s16", layout=layout)
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = start
+        for packet in encoder.encode(frame):
+            if gate is not None and not gate.should_send(block):
+                decoded.append(np.zeros(FRAME_SIZE, np.float32))
+                continue
+            total_bytes += packet.size
+            packets += 1
+            for out in decoder.decode(packet):
+                samples = out.to_ndarray()
+                if out.format.is_planar:
+                    decoded.append(samples[0])
+                else:
+                    decoded.append(samples.reshape(-1, len(out.layout.channels))[:, 0])
+
+    seconds = len(pcm) / SAMPLE_RATE
+    decoded = np.concatenate(decoded) if decoded else np.zeros(0, np.float32)
+    if decoded.dtype.kind == "i":
+        decoded = decoded.astype(np.float32) / 32768
+    return total_bytes * 8 / seconds, packets, snr(signal, decoded), log_spectral_distance(signal, decoded)
+
+
+def align(reference, decoded):
+    """
+    Remove the codec's lookahead delay from `decoded`.
+    """
+    window = min(len(reference), len(decoded) - 1000, SAMPLE_RATE)
+    corr = np.correlate(decoded[:window + 1000], reference[:window], mode="valid")
+    decoded = decoded[int(np.argmax(corr)):]
+    n = min(len(reference), len(decoded))
+    return reference[:n], decoded[:n]
+
+
+def snr(reference, decoded):
+    """
+    SNR in dB after aligning for the codec delay.
+    """
+    reference, decoded = align(reference, decoded)
+    error = reference - decoded
+    return 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-12))
+
+
+def log_spectral_distance(reference, decoded, frame=FRAME_SIZE, dynamic_range=DYNAMIC_RANGE_DB):
+    """
+    Mean log-spectral distance in dB over the frames that carry signal.
+
+    Only bins within `dynamic_range` dB of the frame's reference peak count,
+    and both spectra are floored there: otherwise the near-empty bins above
+    the signal's band dominate, and faint noise in them outweighs missing
+    speech.
+    """
+    reference, decoded = align(reference, decoded)
+    n = len(reference) // frame
+    window = np.hanning(frame)
+    ref = np.abs(np.fft.rfft(reference[:n * frame].reshape(n, frame) * window, axis=1)) ** 2
+    dec = np.abs(np.fft.rfft(decoded[:n * frame].reshape(n, frame) * window, axis=1)) ** 2
+    active = ref.sum(axis=1) > 1e-3 * ref.sum(axis=1).max()
+    ref_db = 10 * np.log10(ref[active] + 1e-20)
+    dec_db = 10 * np.log10(dec[active] + 1e-20)
+    floor = ref_db.max(axis=1, keepdims=True) - dynamic_range
+    bins = ref_db > floor
+    diff = np.where(bins, ref_db - np.maximum(dec_db, floor), 0.0)
+    return float(np.mean(np.sqrt((diff ** 2).sum(axis=1) / bins.sum(axis=1))))
+
+
+def main():
+    signal = load_signal(sys.argv[1]) if len(sys.argv) > 1 else test_signal()
+    print(f"{'preset':<16} {'kbit/s':>8} {'packets':>8} {'SNR dB':>8} {'LSD dB':>8}")
+    for name, settings in PRESETS.items():
+        bitrate, packets, quality, distance = encode_decode(signal, settings)
+        print(f"{name:<16} {bitrate / 1000:>8.1f} {packets:>8} {quality:>8.1f} {distance:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Check that the remote side's Opus fmtp and ptime reach the sender's encoder.
+
+Two peers in this process: A sends the test signal of opus_bandwidth.py
+with local settings of 96 kbit/s, stereo and FEC, B answers with (or without) its own
+receive preferences rewritten into the SDP. After a few seconds the script
+compares A's encoder settings and measured bitrate with what B asked for,
+and exits non-zero on a mismatch.
+
+usage: python benchmarks/opus_negotiation.py [--duration S]
+"""
+import argparse
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.contrib.media import MediaBlackhole
+
+from opus_settings import OpusSettings, apply_to_sdp, install_encoder_hook
+from opus_bandwidth import test_signal
+from network import SignalTrack
+
+LOCAL = OpusSettings(max_bitrate=96000, stereo=True, fec=True)
+CASES = {
+    # B's receive preferences: (settings, expected (bit_rate, ptime, dtx, layout, fec))
+    "no remote fmtp": (None, (96000, None, False, "stereo", True)),
+    "remote 12 kbit/s, 40 ms, dtx": (OpusSettings(max_bitrate=12000, ptime=40, dtx=True), (12000, 40, True, "stereo", True)),
+    "remote stereo=0;useinbandfec=0": (OpusSettings(stereo=False, fec=False), (96000, None, False, "mono", False)),
+}
+
+
+async def run_case(remote, duration):
+    a = RTCPeerConnection()
+    b = RTCPeerConnection()
+    sender = a.addTrack(SignalTrack(test_signal()))
+    sink = MediaBlackhole()
+
+    @b.on("track")
+    async def on_track(track):
+        sink.addTrack(track)
+        await sink.start()
+
+    await a.setLocalDescription(await a.createOffer())
+    await b.setRemoteDescription(a.localDescription)
+    await b.setLocalDescription(await b.createAnswer())
+    answer = b.localDescription.sdp
+    if remote is not None:
+        answer = apply_to_sdp(answer, remote)
+    await a.setRemoteDescription(RTCSessionDescription(answer, "answer"))
+
+    await asyncio.sleep(duration)
+    encoder = sender._RTCRtpSender__encoder
+    sent = 0
+    for report in (await a.getStats()).values():
+        if report.type == "outbound-rtp":
+            sent = report.bytesSent
+    await sink.stop()
+    await a.close()
+    await b.close()
+    return encoder, sent * 8 / duration
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    options = parser.parse_args()
+
+    install_encoder_hook(LOCAL)
+    failed = False
+    for name, (remote, expected) in CASES.items():
+        encoder, measured = await run_case(remote, options.duration)
+        settings = encoder.opus_settings
+        got = (encoder.codec.bit_rate, settings.ptime, hasattr(encoder, "dtx"), encoder.codec.layout.name, settings.fec)
+        ok = got == expected and measured < expected[0] * 1.5
+        failed |= not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {name}: bit_rate={got[0]} ptime={got[1]} dtx={got[2]} layout={got[3]} "
+            f"fec={got[4]} measured={measured / 1000:.1f} kbit/s (expected {expected})"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
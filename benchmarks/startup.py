@@ -0,0 +1,84 @@
+"""
+Cold-start time of each rtc.py command.
+
+Runs `python rtc.py --import-only <command>` in fresh processes and prints
+the median and worst wall time, next to a bare interpreter for reference.
+With --importtime, also lists the slowest imports of each command (from
+`python -X importtime`).
+
+usage: python benchmarks/startup.py [--runs N] [--importtime] [command ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RTC = os.path.join(ROOT, "rtc.py")
+
+COMMANDS = {
+    "answer-server": ["answer-server"],
+    "offer": ["offer"],
+    "mic": ["mic"],
+    "tone": ["tone"],
+    "load": ["load"],
+    "signalling-offer": ["signalling-offer", "benchmark"],
+    "signalling-answer": ["signalling-answer"],
+}
+
+
+def run(argv):
+    started = time.perf_counter()
+    result = subprocess.run(argv, cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - started, result
+
+
+def slowest_imports(args, count=5):
+    """
+    The `count` top-level imports with the largest cumulative time, in ms.
+    """
+    _, result = run([sys.executable, "-X", "importtime", RTC, "--import-only"] + args)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented; keep the ones rtc.py pulled in directly
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("commands", nargs="*", default=list(COMMANDS))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true")
+    options = parser.parse_args()
+
+    print(f"{'command':20} {'median ms':>10} {'max ms':>10}")
+    baseline = [run([sys.executable, "-c", "pass"])[0] for _ in range(options.runs)]
+    print(f"{'(interpreter)':20} {statistics.median(baseline) * 1000:10.0f} {max(baseline) * 1000:10.0f}")
+
+    for name in options.commands:
+        args = COMMANDS[name]
+        times = []
+        for _ in range(options.runs):
+            elapsed, result = run([sys.executable, RTC, "--import-only"] + args)
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode
+                print(f"{name:20} failed: {error}")
+                break
+            times.append(elapsed)
+        else:
+            print(f"{name:20} {statistics.median(times) * 1000:10.0f} {max(times) * 1000:10.0f}")
+            if options.importtime:
+                for ms, module in slowest_imports(args):
+                    print(f"    {module:30} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compact encoding of SDP for the polled signalling API.
+
+The signalling server stores peer1_sdp / peer2_sdp as plain strings and
+both peers GET them on every poll. An aiortc description repeats the ICE
+credentials, fingerprints and boilerplate in every m= section and spells
+fingerprints out as colon-separated hex. The compact form:
+
+  * keeps each distinct line once and refers to repeats by index,
+  * refers to common aiortc boilerplate lines by index into STATIC_LINES,
+  * packs fingerprints into base64,
+  * deflates the result with STATIC_LINES as a preset dictionary.
+
+decode_sdp(encode_sdp(sdp)) == sdp for any SDP, so nothing the peer needs
+is lost. Values without the prefix are passed through untouched, so a peer
+still sending plain SDP keeps working.
+"""
+import base64
+import json
+import re
+import zlib
+
+PREFIX = "c1:"
+
+# Lines aiortc (and browsers) emit verbatim; index 0 is reserved.
+STATIC_LINES = [
+    None,
+    "v=0",
+    "s=-",
+    "t=0 0",
+    "a=msid-semantic:WMS *",
+    "c=IN IP4 0.0.0.0",
+    "a=sendrecv",
+    "a=sendonly",
+    "a=recvonly",
+    "a=inactive",
+    "a=rtcp:9 IN IP4 0.0.0.0",
+    "a=rtcp-mux",
+    "a=rtcp-rsize",
+    "a=end-of-candidates",
+    "a=setup:actpass",
+    "a=setup:active",
+    "a=setup:passive",
+    "a=sctp-port:5000",
+    "a=max-message-size:65536",
+    "a=extmap:1 urn:ietf:params:rtp-hdrext:sdes:mid",
+    "a=extmap:2 urn:ietf:params:rtp-hdrext:ssrc-audio-level",
+    "a=extmap:3 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+    "a=rtpmap:96 opus/48000/2",
+    "a=rtpmap:111 opus/48000/2",
+    "a=rtpmap:9 G722/8000",
+    "a=rtpmap:0 PCMU/8000",
+    "a=rtpmap:8 PCMA/8000",
+    "a=rtpmap:97 VP8/90000",
+    "a=rtcp-fb:97 nack",
+    "a=rtcp-fb:97 nack pli",
+    "a=rtcp-fb:97 goog-remb",
+    "a=rtpmap:98 rtx/90000",
+    "a=fmtp:98 apt=97",
+    "a=rtpmap:99 H264/90000",
+    "a=rtcp-fb:99 nack",
+    "a=rtcp-fb:99 nack pli",
+    "a=rtcp-fb:99 goog-remb",
+    "a=fmtp:99 level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42001f",
+    "a=rtpmap:100 rtx/90000",
+    "a=fmtp:100 apt=99",
+    "a=rtpmap:101 H264/90000",
+    "a=rtcp-fb:101 nack",
+    "a=rtcp-fb:101 nack pli",
+    "a=rtcp-fb:101 goog-remb",
+    "a=fmtp:101 level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42e01f",
+    "a=rtpmap:102 rtx/90000",
+    "a=fmtp:102 apt=101",
+    "a=ptime:20",
+]
+STATIC_INDEX = {line: i for i, line in enumerate(STATIC_LINES) if line is not None}
+
+# Preset dictionary: boilerplate plus the prefixes of the lines that vary.
+ZDICT = "\n".join(
+    [line for line in STATIC_LINES if line is not None]
+    + [
+        "o=- ",
+        " IN IP4 0.0.0.0",
+        "a=group:BUNDLE 0 1 2",
+        "m=audio 9 UDP/TLS/RTP/SAVPF 96 9 0 8",
+        "m=video 9 UDP/TLS/RTP/SAVPF 97 98 99 100 101 102",
+        "m=application 9 UDP/DTLS/SCTP webrtc-datachannel",
+        "c=IN IP4 ",
+        "a=mid:",
+        "a=msid:",
+        "a=ssrc-group:FID ",
+        "a=ssrc:",
+        " cname:",
+        "a=fmtp:96 maxaveragebitrate=24000;useinbandfec=1;stereo=0;sprop-stereo=0",
+        "a=candidate:",
+        " 1 udp 2130706431 ",
+        " typ host",
+        " typ srflx raddr ",
+        " rport ",
+        "a=ice-ufrag:",
+        "a=ice-pwd:",
+    ]
+).encode()
+
+FINGERPRINT = re.compile(r"^a=fingerprint:(sha-\d+) ((?:[0-9A-F]{2}:)*[0-9A-F]{2})$")
+
+
+def _pack(line):
+    match = FINGERPRINT.match(line)
+    if match:
+        digest = bytes.fromhex(match.group(2).replace(":", ""))
+        return ["f", match.group(1), base64.b64encode(digest).decode()]
+    return line
+
+
+def _unpack(item):
+    if isinstance(item, list):
+        _, algorithm, digest = item
+        hex_digest = base64.b64decode(digest).hex().upper()
+        pairs = ":".join(hex_digest[i:i + 2] for i in range(0, len(hex_digest), 2))
+        return f"a=fingerprint:{algorithm} {pairs}"
+    return item
+
+
+def encode_sdp(sdp):
+    """
+    Return the compact, ASCII-safe form of `sdp`.
+    """
+    crlf = "\r\n" in sdp
+    lines = sdp.split("\r\n" if crlf else "\n")
+
+    table = []  # distinct non-static lines, packed
+    seen = {}
+    refs = []  # > 0: static line, <= 0: -index into table
+    for line in lines:
+        if line in STATIC_INDEX:
+            refs.append(STATIC_INDEX[line])
+            continue
+        if line not in seen:
+            seen[line] = len(table)
+            table.append(_pack(line))
+        refs.append(-seen[line])
+
+    body = json.dumps([1 if crlf else 0, table, refs], separators=(",", ":")).encode()
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+    data = compressor.compress(body) + compressor.flush()
+    return PREFIX + base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_sdp(value):
+    """
+    Rebuild the SDP from encode_sdp() output; plain SDP is returned as is.
+    """
+    if not value or not value.startswith(PREFIX):
+        return value
+    token = value[len(PREFIX):]
+    data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    decompressor = zlib.decompressobj(-15, ZDICT)
+    crlf, table, refs = json.loads(decompressor.decompress(data) + decompressor.flush())
+
+    table = [_unpack(item) for item in table]
+    lines = [STATIC_LINES[ref] if ref > 0 else table[-ref] for ref in refs]
+    return ("\r\n" if crlf else "\n").join(lines)
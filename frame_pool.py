@@ -0,0 +1,154 @@
+"""
+Reusable frames for tracks that generate or capture media.
+
+Instead of allocating an AudioFrame, a NumPy array, a bytes copy and a
+Fraction per recv(), a track acquires a pooled frame and writes straight
+into its plane through a NumPy view. VideoFramePool does the same for
+yuv420p VideoFrames.
+"""
+import fractions
+import sys
+from functools import lru_cache
+
+import numpy as np
+from av import AudioFrame, VideoFrame
+
+SAMPLE_DTYPES = {"s16": np.int16, "flt": np.float32}
+
+
+@lru_cache(maxsize=None)
+def time_base(samplerate):
+    """
+    Shared Fraction(1, samplerate); Fractions are immutable so one per rate
+    is enough for every track.
+    """
+    return fractions.Fraction(1, samplerate)
+
+
+class FramePool:
+    """
+    A ring of frames of one shape; subclasses create them and set
+    `time_base`.
+
+    A frame is only handed out again once nothing but the pool references
+    it, i.e. the encoder (or a recorder, or a relay) has dropped it. This
+    is checked with the CPython reference count against the count measured
+    when the frame was idle. If every frame is busy the pool grows up to
+    `max_size`, after which it falls back to a fresh, unpooled frame.
+    """
+
+    def __init__(self, size=4, max_size=32):
+        self.max_size = max_size
+        self._entries = []
+        self._next = 0
+        self._idle_refs = None
+
+        # metrics
+        self.reused = 0
+        self.allocated = 0
+        self.overflow = 0
+
+        for _ in range(size):
+            self._add()
+
+    def _new_frame(self):
+        """
+        Return (frame, view) for a new, unpooled frame.
+        """
+        raise NotImplementedError
+
+    def _add(self):
+        entry = self._new_frame()
+        self._entries.append(entry)
+        self.allocated += 1
+        if self._idle_refs is None:
+            self._idle_refs = self._refs(entry[0])
+        return entry
+
+    @staticmethod
+    def _refs(frame):
+        # must be called the same way from _add() and acquire() so the
+        # temporaries on the stack are identical
+        return sys.getrefcount(frame)
+
+    def acquire(self, pts):
+        """
+        Return (frame, view) where view writes straight into the frame.
+        """
+        count = len(self._entries)
+        for i in range(count):
+            index = (self._next + i) % count
+            entry = self._entries[index]
+            if self._refs(entry[0]) <= self._idle_refs:
+                self._next = (index + 1) % count
+                self.reused += 1
+                # encoders may have rebased the frame to their own time base
+                entry[0].time_base = self.time_base
+                entry[0].pts = pts
+                return entry
+
+        if count < self.max_size:
+            frame, view = self._add()
+        else:
+            self.overflow += 1
+            frame, view = self._new_frame()
+        frame.pts = pts
+        return frame, view
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "reused": self.reused,
+            "allocated": self.allocated,
+            "overflow": self.overflow,
+        }
+
+
+class AudioFramePool(FramePool):
+    """
+    AudioFrames of `samples` samples; the view is a (samples, channels)
+    array over the frame's plane.
+    """
+
+    def __init__(self, samples, samplerate=48000, layout="mono", format="s16", size=4, max_size=32):
+        self.samples = samples
+        self.samplerate = samplerate
+        self.layout = layout
+        self.format = format
+        self.channels = 1 if layout == "mono" else 2
+        self.time_base = time_base(samplerate)
+        super().__init__(size, max_size)
+
+    def _new_frame(self):
+        frame = AudioFrame(format=self.format, layout=self.layout, samples=self.samples)
+        frame.sample_rate = self.samplerate
+        frame.time_base = self.time_base
+        view = np.ndarray(
+            (self.samples, self.channels),
+            dtype=SAMPLE_DTYPES[self.format],
+            buffer=frame.planes[0],
+        )
+        return frame, view
+
+
+class VideoFramePool(FramePool):
+    """
+    yuv420p VideoFrames; the view is a (y, u, v) tuple of uint8 arrays over
+    the planes, (height, width) and (height / 2, width / 2), skipping the
+    line padding.
+    """
+
+    def __init__(self, width, height, clock_rate=90000, size=4, max_size=32):
+        self.width = width
+        self.height = height
+        self.time_base = time_base(clock_rate)
+        super().__init__(size, max_size)
+
+    def _new_frame(self):
+        frame = VideoFrame(width=self.width, height=self.height, format="yuv420p")
+        frame.time_base = self.time_base
+        view = tuple(
+            np.ndarray((plane.height, plane.width), dtype=np.uint8, buffer=plane, strides=(plane.line_size, 1))
+            for plane in frame.planes
+        )
+        return frame, view
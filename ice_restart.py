@@ -0,0 +1,269 @@
+"""
+ICE restart for aiortc peer connections.
+
+aiortc has no ICE restart: once the nominated candidate pair stops working
+(Wi-Fi -> LTE handover) consent checks expire after ~30 s, DTLS fails and
+the scripts close the whole RTCPeerConnection.
+
+IceRestart renegotiates only the transport. For each RTCIceTransport it
+gathers a fresh aioice Connection with new credentials, exchanges
+ufrag/pwd/candidates with the remote over the existing signalling channel,
+runs connectivity checks, and then lets the existing Connection adopt the
+new sockets, nominated pair and credentials. DTLS, SRTP, SCTP, tracks, data
+channels and recorders keep running on top of the same objects and never
+notice. This relies on aioice internals and only works while the old
+transport has not failed yet, which is what RestartMonitor is for.
+"""
+import asyncio
+import time
+
+from aioice import Candidate, Connection
+from aioice.ice import get_host_addresses
+
+
+def ice_transports(pc):
+    """
+    The distinct RTCIceTransports of `pc`, in m-line order (one when
+    BUNDLE is in use).
+    """
+    transports = []
+    for transceiver in pc.getTransceivers():
+        transport = transceiver.receiver.transport.transport
+        if transport not in transports:
+            transports.append(transport)
+    if pc.sctp is not None and pc.sctp.transport.transport not in transports:
+        transports.append(pc.sctp.transport.transport)
+    return transports
+
+
+def _new_connection(old):
+    return Connection(
+        ice_controlling=old.ice_controlling,
+        stun_server=old.stun_server,
+        turn_server=old.turn_server,
+        turn_username=old.turn_username,
+        turn_password=old.turn_password,
+        turn_ssl=old.turn_ssl,
+        turn_transport=old.turn_transport,
+        use_ipv4=old._use_ipv4,
+        use_ipv6=old._use_ipv6,
+        transport_policy=old._transport_policy,
+    )
+
+
+async def _adopt(old, new):
+    """
+    Move `new`'s sockets, nominated pair and credentials into `old`.
+    """
+    if old._query_consent_task is not None:
+        old._query_consent_task.cancel()
+        old._query_consent_task = None
+    if new._query_consent_task is not None:
+        new._query_consent_task.cancel()
+        new._query_consent_task = None
+
+    old_protocols = old._protocols
+    for protocol in new._protocols:
+        protocol.receiver = old
+    old._protocols = new._protocols
+    old._nominated = new._nominated
+    old._local_candidates = new._local_candidates
+    old._remote_candidates = new._remote_candidates
+    old._check_list = new._check_list
+    old._local_username = new._local_username
+    old._local_password = new._local_password
+    old.remote_username = new.remote_username
+    old.remote_password = new.remote_password
+    old._query_consent_task = asyncio.ensure_future(old.query_consent())
+
+    # the discarded Connection absorbs the old sockets' connection_lost,
+    # which would otherwise end the stream DTLS is reading from
+    new._protocols = []
+    new._nominated = {}
+    new._closed = True
+    for protocol in old_protocols:
+        protocol.receiver = new
+        await protocol.close()
+
+
+class IceRestart:
+    """
+    One ICE restart of every transport of a peer connection.
+
+    Both sides create one with `await IceRestart.create(pc)`, swap
+    `local_parameters()` over signalling and call `complete()` with the
+    remote's parameters. Used as an async context manager, the restart is
+    closed if anything in the block raises (or is cancelled) before it
+    completes:
+
+        async with await IceRestart.create(pc) as ice_restart:
+            remote = await signal(ice_restart.local_parameters())
+            await ice_restart.complete(remote)
+    """
+
+    def __init__(self, pc, transports, connections):
+        self.pc = pc
+        self.transports = transports
+        self.connections = connections
+        self.started = time.monotonic()
+        self.completed = False
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            await self.close()
+
+    @classmethod
+    async def create(cls, pc):
+        transports = ice_transports(pc)
+        connections = [_new_connection(t._connection) for t in transports]
+        try:
+            await asyncio.gather(*(c.gather_candidates() for c in connections))
+        except BaseException:
+            # including cancellation: no sockets may outlive a failed restart
+            await asyncio.gather(*(c.close() for c in connections), return_exceptions=True)
+            raise
+        return cls(pc, transports, connections)
+
+    def local_parameters(self):
+        return [
+            {
+                "ufrag": c.local_username,
+                "pwd": c.local_password,
+                "candidates": [candidate.to_sdp() for candidate in c.local_candidates],
+            }
+            for c in self.connections
+        ]
+
+    async def close(self):
+        """
+        Abandon the restart, e.g. when the remote refused it. Does nothing
+        once the restart has completed or been closed.
+        """
+        if self.completed or self.closed:
+            return
+        self.closed = True
+        for connection in self.connections:
+            # aioice's close() leaves running checks to retransmit on closed sockets
+            for pair in connection._check_list:
+                if pair.task is not None:
+                    pair.task.cancel()
+        await asyncio.gather(*(c.close() for c in self.connections), return_exceptions=True)
+
+    async def complete(self, remote_parameters):
+        """
+        Run connectivity checks and switch over. Returns the seconds since
+        create(); raises ConnectionError if no new pair could be nominated.
+        """
+        try:
+            if len(remote_parameters) != len(self.connections):
+                raise ValueError("Remote restarted a different number of transports")
+            await asyncio.gather(*(
+                self._connect(connection, params)
+                for connection, params in zip(self.connections, remote_parameters)
+            ))
+        except BaseException:
+            await self.close()
+            raise
+        self.completed = True
+        for transport, connection in zip(self.transports, self.connections):
+            await _adopt(transport._connection, connection)
+        return time.monotonic() - self.started
+
+    @staticmethod
+    async def _connect(connection, params):
+        connection.remote_username = params["ufrag"]
+        connection.remote_password = params["pwd"]
+        for candidate in params["candidates"]:
+            await connection.add_remote_candidate(Candidate.from_sdp(candidate))
+        await connection.add_remote_candidate(None)
+        await connection.connect()
+
+
+class RestartMonitor:
+    """
+    Watches a peer connection and calls `restart()` (a coroutine function
+    doing the signalling round trip) when the local addresses change or no
+    datagram has arrived for `stall_timeout` seconds.
+
+    The stall check only makes sense while media (RTP/RTCP) is flowing; set
+    `stall_timeout=None` for data-channel-only connections.
+    """
+
+    def __init__(self, pc, restart, stall_timeout=2.0, interval=0.5, max_attempts=5):
+        self.pc = pc
+        self.restart = restart
+        self.stall_timeout = stall_timeout
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.last_received = time.monotonic()
+        self.recoveries = []  # seconds from the last datagram before the outage to the first after it
+        self._recovering_since = None
+        self._task = None
+        self._wrapped = set()
+
+    def _wrap(self, transport):
+        # count every datagram handed to DTLS, RTP and SCTP alike
+        if transport in self._wrapped:
+            return
+        self._wrapped.add(transport)
+        recv = transport._recv
+
+        async def counted_recv():
+            data = await recv()
+            self.last_received = time.monotonic()
+            if self._recovering_since is not None:
+                self.recoveries.append(self.last_received - self._recovering_since)
+                print(f"ICE restart: media recovered in {self.recoveries[-1]:.2f}s")
+                self._recovering_since = None
+            return data
+
+        transport._recv = counted_recv
+
+    def _addresses(self):
+        return set(get_host_addresses(use_ipv4=True, use_ipv6=True))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        addresses = self._addresses()
+        attempts = 0
+        while self.pc.connectionState not in ("closed", "failed"):
+            await asyncio.sleep(self.interval)
+            if self.pc.connectionState != "connected":
+                continue
+            for transport in ice_transports(self.pc):
+                self._wrap(transport)
+
+            current = self._addresses()
+            reason = None
+            if current != addresses:
+                reason = "network change"
+            elif self.stall_timeout is not None and time.monotonic() - self.last_received > self.stall_timeout:
+                reason = "no packets for %.1fs" % (time.monotonic() - self.last_received)
+            if reason is None:
+                attempts = 0
+                continue
+            if attempts >= self.max_attempts:
+                continue
+
+            attempts += 1
+            addresses = current
+            if self._recovering_since is None:
+                self._recovering_since = self.last_received
+            print(f"ICE restart ({reason}), attempt {attempts}")
+            try:
+                elapsed = await self.restart()
+                print(f"ICE restart: new pair nominated in {elapsed:.2f}s")
+                self.last_received = time.monotonic()
+            except Exception as e:
+                print("ICE restart failed:", e)
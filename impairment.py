@@ -0,0 +1,366 @@
+"""
+Local UDP impairment proxy for reproducible network conditions.
+
+ImpairmentProxy sits between two peers on one host. It replaces the ICE
+candidates in each side's SDP with one of its own sockets, so every
+datagram (STUN, DTLS, SRTP, SCTP) of the call crosses it, and each
+direction passes through an ImpairedLink applying a LinkProfile: delay,
+jitter, random and bursty loss, reordering and a bandwidth cap with a
+bounded queue. A Scenario changes the profiles over time (a Wi-Fi to LTE
+handover, a congestion ramp, ...).
+
+Between two peers in one process:
+
+    proxy = ImpairmentProxy(PROFILES["lte"])
+    await b.setRemoteDescription(RTCSessionDescription(await proxy.offer(a_sdp), "offer"))
+    ...
+    await a.setRemoteDescription(RTCSessionDescription(proxy.answer(b_sdp), "answer"))
+
+Between an offer client and answer.py, run the HTTP front end and point the
+client's SERVER_URL at it:
+
+    python impairment.py --scenario handover  (listens on :8081)
+
+ICE restarts through /restart are not routed through the proxy.
+"""
+import asyncio
+import random
+import re
+
+CANDIDATE = re.compile(r"^a=candidate:\S+ (\d) (udp|UDP) \d+ (\S+) (\d+) typ host")
+
+
+class LinkProfile:
+    """
+    Conditions of one direction of a link.
+
+    `loss` is the random loss probability. Bursts follow a Gilbert-Elliott
+    model: each packet enters a burst with probability `burst_rate` and a
+    burst loses `burst_length` packets on average. `reorder` is the share
+    of packets held back by an extra `delay_ms`. `rate_kbps` caps the
+    bandwidth; packets that would wait longer than `queue_ms` are dropped.
+    """
+
+    def __init__(self, delay_ms=0, jitter_ms=0, loss=0.0, burst_rate=0.0, burst_length=1, reorder=0.0, rate_kbps=None, queue_ms=200):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self.reorder = reorder
+        self.rate_kbps = rate_kbps
+        self.queue_ms = queue_ms
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v}" for k, v in vars(self).items())
+        return f"LinkProfile({fields})"
+
+
+PROFILES = {
+    "clean": LinkProfile(),
+    "wifi": LinkProfile(delay_ms=5, jitter_ms=3, loss=0.005),
+    "lte": LinkProfile(delay_ms=40, jitter_ms=15, loss=0.01, reorder=0.01, rate_kbps=5000),
+    "congested": LinkProfile(delay_ms=60, jitter_ms=30, loss=0.02, rate_kbps=300, queue_ms=400),
+    "bursty": LinkProfile(delay_ms=30, jitter_ms=10, burst_rate=0.01, burst_length=8),
+    "satellite": LinkProfile(delay_ms=300, jitter_ms=20, loss=0.005, rate_kbps=2000),
+    "edge": LinkProfile(delay_ms=150, jitter_ms=60, loss=0.03, burst_rate=0.005, burst_length=5, rate_kbps=80, queue_ms=500),
+    "blackout": LinkProfile(loss=1.0),
+}
+
+
+class ImpairedLink:
+    """
+    One direction: send(data, deliver) calls deliver(data) later, or never.
+    """
+
+    def __init__(self, profile, rng=None):
+        self.profile = profile
+        self.rng = rng or random.Random()
+        self.loop = asyncio.get_running_loop()
+        self._in_burst = False
+        self._link_free = 0.0  # when the bottleneck finishes the queued bytes
+        self._last_departure = 0.0
+        self.closed = False
+
+        # metrics
+        self.sent = 0
+        self.delivered = 0
+        self.lost = 0
+        self.queue_dropped = 0
+        self.reordered = 0
+
+    def _lost(self):
+        p = self.profile
+        if self._in_burst:
+            if self.rng.random() < 1.0 / max(p.burst_length, 1):
+                self._in_burst = False
+            return True
+        if p.burst_rate and self.rng.random() < p.burst_rate:
+            self._in_burst = True
+            return True
+        return p.loss > 0 and self.rng.random() < p.loss
+
+    def send(self, data, deliver):
+        p = self.profile
+        now = self.loop.time()
+        self.sent += 1
+        if self._lost():
+            self.lost += 1
+            return
+
+        departure = now
+        if p.rate_kbps:
+            start = max(now, self._link_free)
+            if start - now > p.queue_ms / 1000:
+                self.queue_dropped += 1
+                return
+            self._link_free = start + len(data) * 8 / (p.rate_kbps * 1000)
+            departure = self._link_free
+
+        departure += (p.delay_ms + self.rng.uniform(-p.jitter_ms, p.jitter_ms)) / 1000
+        if p.reorder and self.rng.random() < p.reorder:
+            # held back past the packets that follow
+            departure += max(p.delay_ms, 10) / 1000
+            self.reordered += 1
+        else:
+            # jitter alone does not reorder a single path
+            departure = max(departure, self._last_departure)
+            self._last_departure = departure
+
+        self.loop.call_at(max(departure, now), self._deliver, deliver, data)
+
+    def _deliver(self, deliver, data):
+        if self.closed:
+            return
+        self.delivered += 1
+        deliver(data)
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "delivered": self.delivered,
+            "lost": self.lost,
+            "queue_dropped": self.queue_dropped,
+            "reordered": self.reordered,
+        }
+
+
+class _Socket(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr)
+
+
+def host_candidate(sdp):
+    """
+    Address of the first UDP host candidate (component 1) in `sdp`.
+    """
+    for line in sdp.splitlines():
+        match = CANDIDATE.match(line)
+        if match and match.group(1) == "1":
+            return match.group(3), int(match.group(4))
+    raise ValueError("SDP has no UDP host candidate")
+
+
+def replace_candidates(sdp, address):
+    """
+    Replace every candidate in `sdp` with one host candidate at `address`.
+    """
+    crlf = "\r\n" if "\r\n" in sdp else "\n"
+    host, port = address
+    lines = []
+    for line in sdp.split(crlf):
+        if line.startswith("a=candidate:"):
+            continue
+        if line == "a=end-of-candidates":
+            lines.append(f"a=candidate:1 1 udp 2130706431 {host} {port} typ host")
+        lines.append(line)
+    return crlf.join(lines)
+
+
+class ImpairmentProxy:
+    """
+    Relays one call between an offerer A and an answerer B. `forward`
+    applies from A to B, `backward` (default: the same) from B to A.
+    """
+
+    def __init__(self, forward=None, backward=None, seed=None):
+        rng = random.Random(seed)
+        self.forward = ImpairedLink(forward or PROFILES["clean"], rng)
+        self.backward = ImpairedLink(backward or forward or PROFILES["clean"], rng)
+        self.a_address = None
+        self.b_address = None
+        self._to_a = None  # stands in for B towards A
+        self._to_b = None  # stands in for A towards B
+        self.last_activity = self.forward.loop.time()  # last datagram either way
+
+    async def _open(self, host, on_datagram):
+        loop = asyncio.get_running_loop()
+        _, protocol = await loop.create_datagram_endpoint(lambda: _Socket(on_datagram), local_addr=(host, 0))
+        return protocol
+
+    async def offer(self, sdp):
+        """
+        A's offer as B must see it: A's candidates replaced by the proxy.
+        """
+        self.a_address = host_candidate(sdp)
+        if self._to_a is None:
+            self._to_a = await self._open(self.a_address[0], self._from_a)
+            self._to_b = await self._open(self.a_address[0], self._from_b)
+        return replace_candidates(sdp, self._to_b.transport.get_extra_info("sockname")[:2])
+
+    def answer(self, sdp):
+        """
+        B's answer as A must see it: B's candidates replaced by the proxy.
+        """
+        self.b_address = host_candidate(sdp)
+        return replace_candidates(sdp, self._to_a.transport.get_extra_info("sockname")[:2])
+
+    def _from_a(self, data, addr):
+        self.last_activity = self.forward.loop.time()
+        if self.b_address is not None:
+            self.forward.send(data, lambda d: self._to_b.transport.sendto(d, self.b_address))
+
+    def _from_b(self, data, addr):
+        self.last_activity = self.forward.loop.time()
+        self.backward.send(data, lambda d: self._to_a.transport.sendto(d, self.a_address))
+
+    def set_profiles(self, forward, backward=None):
+        self.forward.profile = forward
+        self.backward.profile = backward or forward
+
+    def close(self):
+        # packets still in flight are dropped with the sockets
+        self.forward.closed = self.backward.closed = True
+        for side in (self._to_a, self._to_b):
+            if side is not None:
+                side.transport.close()
+
+    def stats(self):
+        return {"forward": self.forward.stats(), "backward": self.backward.stats()}
+
+
+class Scenario:
+    """
+    A timeline of (seconds, forward profile, backward profile or None).
+    The last step lasts until the scenario is stopped.
+    """
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+
+    async def play(self, proxy):
+        for seconds, forward, backward in self.steps:
+            proxy.set_profiles(forward, backward)
+            await asyncio.sleep(seconds)
+
+
+def steady(name):
+    return Scenario(name, [(0, PROFILES[name], None)])
+
+
+SCENARIOS = {
+    **{name: steady(name) for name in ("clean", "wifi", "lte", "congested", "bursty", "satellite", "edge")},
+    # Wi-Fi drops for two seconds, then LTE takes over
+    "handover": Scenario("handover", [(5, PROFILES["wifi"], None), (2, PROFILES["blackout"], None), (0, PROFILES["lte"], None)]),
+    # uplink bandwidth shrinks step by step, the downlink stays clean
+    "congestion_ramp": Scenario("congestion_ramp", [
+        (3, LinkProfile(delay_ms=20, rate_kbps=1000), PROFILES["clean"]),
+        (3, LinkProfile(delay_ms=20, rate_kbps=200), PROFILES["clean"]),
+        (3, LinkProfile(delay_ms=20, rate_kbps=50), PROFILES["clean"]),
+        (0, LinkProfile(delay_ms=20, rate_kbps=1000), PROFILES["clean"]),
+    ]),
+}
+
+
+def http_front(server_url, scenario, seed=None, idle_timeout=30.0, reap_interval=5.0):
+    """
+    aiohttp app forwarding POST /offer to `server_url` (answer.py) with
+    every call routed through its own ImpairmentProxy playing `scenario`.
+    The front end never sees a call end, so a proxy that has relayed
+    nothing for `idle_timeout` seconds (ICE consent checks keep a live
+    call busier than that) is closed and forgotten.
+    """
+    import aiohttp
+    from aiohttp import web
+
+    proxies = []  # (proxy, scenario task)
+    reaper = None
+
+    def close(entry):
+        proxy, task = entry
+        task.cancel()
+        proxy.close()
+
+    async def reap():
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(reap_interval)
+            now = loop.time()
+            for entry in list(proxies):
+                if now - entry[0].last_activity > idle_timeout:
+                    print(f"Closing idle proxy {entry[0].a_address} <-> {entry[0].b_address}")
+                    proxies.remove(entry)
+                    close(entry)
+
+    async def offer(request):
+        data = await request.json()
+        proxy = ImpairmentProxy(seed=seed)
+        try:
+            data["offer"] = await proxy.offer(data["offer"])
+            async with aiohttp.ClientSession() as session:
+                async with session.post(server_url, json=data) as response:
+                    text = await response.text()
+                    headers = {k: v for k, v in response.headers.items() if k.lower() in ("retry-after", "x-session-token")}
+            if response.status != 200:
+                proxy.close()
+                return web.Response(status=response.status, text=text, headers=headers)
+            answer = proxy.answer(text)
+        except BaseException:
+            # a bad offer, an unreachable server or a cancelled request
+            proxy.close()
+            raise
+        proxies.append((proxy, asyncio.ensure_future(scenario.play(proxy))))
+        return web.Response(text=answer, headers=headers)
+
+    async def stats(request):
+        return web.json_response([proxy.stats() for proxy, _ in proxies])
+
+    async def on_startup(app):
+        nonlocal reaper
+        reaper = asyncio.ensure_future(reap())
+
+    async def on_shutdown(app):
+        reaper.cancel()
+        for entry in proxies:
+            close(entry)
+        proxies.clear()
+
+    app = web.Application()
+    app.router.add_post("/offer", offer)
+    app.router.add_get("/stats", stats)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description="Impair calls between an offer client and answer.py")
+    parser.add_argument("--scenario", default="lte", choices=sorted(SCENARIOS))
+    parser.add_argument("--server", default="http://localhost:8080/offer")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--idle-timeout", type=float, default=30.0, help="close a call's proxy after this many silent seconds")
+    args = parser.parse_args()
+    web.run_app(http_front(args.server, SCENARIOS[args.scenario], args.seed, args.idle_timeout), port=args.port)
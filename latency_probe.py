@@ -0,0 +1,191 @@
+"""
+Mouth-to-ear latency from chirp markers in the audio itself.
+
+The sender mixes a short chirp into its audio whenever the wall clock
+crosses a multiple of MARKER_INTERVAL (ChirpMarkers, used by the tone
+generator). The receiver (LatencyProbe, used by answer.py) reads the
+decoded frames, finds the chirps by FFT cross-correlation and takes, for
+each, the time its first sample came out of the receiver minus the second
+it was captured on. That covers everything in between: encoder lookahead,
+packetization, the network, the jitter buffer and the decode.
+
+Both sides use time.time(), so on separate hosts their clocks must be
+synchronised (NTP) to better than the latency being measured. Latencies
+are taken modulo MARKER_INTERVAL, so anything above it wraps around.
+
+    python rtc.py answer-server --latency latency.jsonl
+    python rtc.py tone --latency
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+from aiortc.mediastreams import MediaStreamError
+
+from resample import OPUS_RATE
+
+MARKER_INTERVAL = 1.0  # seconds, and the largest latency that can be told apart
+CHIRP_DURATION = 0.05
+CHIRP_BAND = (500.0, 3000.0)  # inside what even narrowband Opus keeps
+CHIRP_AMPLITUDE = 0.3
+DETECTION_THRESHOLD = 0.5  # normalised correlation
+
+
+def chirp(rate=OPUS_RATE, duration=CHIRP_DURATION, band=CHIRP_BAND):
+    """
+    Hann-windowed linear chirp, peak 1.0, as float32.
+    """
+    t = np.arange(int(rate * duration)) / rate
+    f0, f1 = band
+    phase = 2 * np.pi * (f0 * t + (f1 - f0) * t * t / (2 * duration))
+    return (np.sin(phase) * np.hanning(len(t))).astype(np.float32)
+
+
+def percentiles(latencies):
+    """
+    Summary of latencies (seconds) in milliseconds.
+    """
+    if not latencies:
+        return {"markers": 0}
+    ms = np.array(latencies) * 1000
+    return {
+        "markers": len(ms),
+        "min_ms": round(float(ms.min()), 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+class ChirpMarkers:
+    """
+    Mixes a chirp into a track's samples at every multiple of `interval`
+    on the wall clock.
+    """
+
+    def __init__(self, rate=OPUS_RATE, interval=MARKER_INTERVAL, amplitude=CHIRP_AMPLITUDE):
+        self.rate = rate
+        self.interval = interval
+        self.template = chirp(rate) * amplitude
+        self._offset = None  # position in the template of a chirp in progress
+        self._next = None  # wall time of the next marker
+        self.sent = 0
+
+    def mix(self, samples, capture_time):
+        """
+        Add the markers due in `samples` (float, mono, in place), whose
+        first sample was captured at `capture_time`.
+        """
+        if self._next is None:
+            self._next = (capture_time // self.interval + 1) * self.interval
+        if self._offset is None:
+            if capture_time > self._next:
+                # a late frame skipped past the marker; wait for the next one
+                self._next = (capture_time // self.interval + 1) * self.interval
+            start = int(round((self._next - capture_time) * self.rate))
+            if start >= len(samples):
+                return
+            self._offset = 0
+            self._next += self.interval
+            self.sent += 1
+        else:
+            start = 0
+        # later frames continue the chirp sample by sample, whatever their timing
+        count = min(len(self.template) - self._offset, len(samples) - start)
+        samples[start:start + count] += self.template[self._offset:self._offset + count]
+        self._offset += count
+        if self._offset >= len(self.template):
+            self._offset = None
+
+
+class LatencyProbe:
+    """
+    Consumes received audio tracks, like MediaBlackhole, and measures the
+    latency of the ChirpMarkers in them. Prints percentiles every
+    `report_every` markers; stop() appends a summary line to `results`
+    (JSON lines) if given.
+    """
+
+    def __init__(self, results=None, label="", interval=MARKER_INTERVAL, report_every=10):
+        self.results = results
+        self.label = label
+        self.interval = interval
+        self.report_every = report_every
+        self.template = chirp()
+        self.hop = int(interval / 2 * OPUS_RATE)
+        self.latencies = []
+        self._tracks = []
+        self._tasks = []
+        self._stopped = False
+
+    def addTrack(self, track):
+        if track.kind == "audio":
+            self._tracks.append(track)
+
+    async def start(self):
+        for track in self._tracks:
+            self._tasks.append(asyncio.ensure_future(self._run(track)))
+
+    async def _run(self, track):
+        length = len(self.template)
+        buffer = np.zeros(0, np.float32)
+        times = np.zeros(0)  # wall time each buffered sample came out
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+            arrival = time.time()
+            channels = len(frame.layout.channels)
+            samples = frame.to_ndarray().reshape(-1, channels)[:, 0].astype(np.float32) / 32768
+            buffer = np.concatenate([buffer, samples])
+            times = np.concatenate([times, arrival + np.arange(len(samples)) / frame.sample_rate])
+
+            # windows of hop + chirp samples, one hop apart: each chirp starts
+            # in exactly one hop and fits whole in its window
+            while len(buffer) >= self.hop + length:
+                onset = self._find(buffer[:self.hop + length])
+                if onset is not None:
+                    self._record(times[onset])
+                buffer = buffer[self.hop:]
+                times = times[self.hop:]
+
+    def _find(self, window):
+        """
+        Start of the chirp in the first `hop` samples of `window`, or None.
+        """
+        length = len(self.template)
+        size = 1 << int(len(window) + length - 1).bit_length()
+        correlation = np.fft.irfft(np.fft.rfft(window, size) * np.conj(np.fft.rfft(self.template, size)), size)[:self.hop]
+        energy = np.concatenate([[0.0], np.cumsum(window.astype(np.float64) ** 2)])
+        norm = np.sqrt(energy[length:length + self.hop] - energy[:self.hop]) * np.linalg.norm(self.template)
+        score = correlation / np.maximum(norm, 1e-9)
+        onset = int(np.argmax(score))
+        return onset if score[onset] >= DETECTION_THRESHOLD else None
+
+    def _record(self, playout):
+        latency = playout % self.interval
+        self.latencies.append(latency)
+        if len(self.latencies) % self.report_every == 0:
+            summary = percentiles(self.latencies[-self.report_every * 10:])
+            print(
+                f"Latency {self.label}: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                f"max {summary['max_ms']} ms (last {summary['markers']} markers, now {latency * 1000:.1f} ms)"
+            )
+
+    def stats(self):
+        return {"label": self.label, **percentiles(self.latencies)}
+
+    async def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        for task in self._tasks:
+            task.cancel()
+        summary = self.stats()
+        print(f"Latency {self.label}: {summary}")
+        if self.results:
+            with open(self.results, "a") as f:
+                f.write(json.dumps({"time": time.time(), **summary, "latencies_ms": [round(x * 1000, 1) for x in self.latencies]}) + "\n")
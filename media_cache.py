@@ -0,0 +1,213 @@
+"""
+Decode-once media cache for tracks served to many callers.
+
+MediaPlayer decodes (and aiortc then re-encodes) its file in real time for
+every peer. The cache decodes a source once into a file under CACHE_DIR:
+
+  * PCM: interleaved int16 at 48 kHz, served as AudioFrames (aiortc still
+    encodes them, so the encoder hook and DTX apply),
+  * Opus: the packets of one encode with given OpusSettings plus an index,
+    served as av.Packets that aiortc sends without encoding at all. Only
+    while the remote's fmtp agrees with those settings: one that asks for
+    a lower bitrate, another ptime, DTX, or a different stereo or FEC
+    preference gets PCM, so the encoder hook can apply what it asked for.
+
+Cache files are named after the source path, size, mtime and parameters,
+written under a temporary name and renamed into place, so concurrent
+processes never read a partial file. They are memory-mapped read-only; all
+tracks of a process share one mapping and all processes share the page
+cache, so a caller costs a copy of 20 ms of audio per frame and its pacing.
+"""
+import asyncio
+import hashlib
+import os
+from functools import lru_cache
+
+import av
+import numpy as np
+from aiortc.contrib.media import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+from frame_pool import AudioFramePool, time_base
+from opus_settings import MUSIC, OpusSettings, configure_codec
+from resample import OPUS_FRAME, OPUS_RATE
+
+CACHE_DIR = os.environ.get("RTC_MEDIA_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "rtc-media"))
+
+
+def _cache_path(source, kind, *params):
+    stat = os.stat(source)
+    key = "|".join(str(p) for p in (os.path.abspath(source), stat.st_size, stat.st_mtime_ns, kind) + params)
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f"{name}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.{kind}")
+
+
+def _decode(source, layout):
+    """
+    Yield the source as (samples, channels) int16 arrays at 48 kHz.
+    """
+    resampler = av.AudioResampler(format="s16", layout=layout, rate=OPUS_RATE)
+    with av.open(source) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                yield out.to_ndarray().reshape(-1, len(out.layout.channels))
+        for out in resampler.resample(None):
+            yield out.to_ndarray().reshape(-1, len(out.layout.channels))
+
+
+def cache_pcm(source, layout="stereo"):
+    """
+    Path of the PCM cache of `source`, decoding it first if needed.
+    """
+    path = _cache_path(source, "s16", layout)
+    if not os.path.exists(path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            for block in _decode(source, layout):
+                f.write(block.tobytes())
+        os.replace(tmp, path)
+    return path
+
+
+def cache_opus(source, settings=MUSIC):
+    """
+    Path of the Opus cache of `source` (packets in `path`, their offsets in
+    `path + ".idx"`), encoding it first if needed. Packets are always
+    20 ms, the track's pacing step.
+    """
+    settings = OpusSettings(max_bitrate=settings.max_bitrate, ptime=20, fec=settings.fec, stereo=settings.stereo)
+    layout = "stereo" if settings.stereo else "mono"
+    path = _cache_path(source, "opus", layout, settings.max_bitrate, settings.fec)
+    if not os.path.exists(path + ".idx"):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        encoder = av.CodecContext.create("libopus", "w")
+        encoder.sample_rate = OPUS_RATE
+        encoder.layout = layout
+        encoder.format = "s16"
+        encoder.time_base = time_base(OPUS_RATE)
+        configure_codec(encoder, settings)
+
+        offsets = [0]
+        pending = np.zeros((0, len(encoder.layout.channels)), np.int16)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            def write(packets):
+                for packet in packets:
+                    data = bytes(packet)
+                    f.write(data)
+                    offsets.append(offsets[-1] + len(data))
+
+            pts = 0
+            for block in _decode(source, layout):
+                pending = np.concatenate([pending, block])
+                while len(pending) >= OPUS_FRAME:
+                    frame = av.AudioFrame.from_ndarray(pending[:OPUS_FRAME].reshape(1, -1), format="s16", layout=layout)
+                    frame.sample_rate = OPUS_RATE
+                    frame.pts = pts
+                    pts += OPUS_FRAME
+                    pending = pending[OPUS_FRAME:]
+                    write(encoder.encode(frame))
+            write(encoder.encode(None))
+        os.replace(tmp, path)
+        tmp_index = f"{path}.{os.getpid()}.idx.tmp.npy"
+        np.save(tmp_index, np.array(offsets, dtype=np.uint64))
+        # the index appears last and marks the cache complete
+        os.replace(tmp_index, path + ".idx")
+    return path
+
+
+@lru_cache(maxsize=None)
+def _map_pcm(path, channels):
+    return np.memmap(path, dtype=np.int16, mode="r").reshape(-1, channels)
+
+
+@lru_cache(maxsize=None)
+def _map_opus(path):
+    return np.memmap(path, dtype=np.uint8, mode="r"), np.load(path + ".idx", mmap_mode="r")
+
+
+class CachedAudioTrack(MediaStreamTrack):
+    """
+    Plays `source` from the cache in real time, looping by default.
+
+    With `encoded` the track yields pre-encoded Opus packets (encoded once
+    with `settings`); otherwise 20 ms PCM frames in `layout`. After the
+    last loop the track ends. install_encoder_hook() calls negotiate()
+    with the remote's preferences, which may switch the track to PCM.
+    """
+
+    kind = "audio"
+
+    def __init__(self, source, encoded=True, settings=MUSIC, layout="stereo", loop=True):
+        super().__init__()
+        self.source = source
+        self.settings = settings
+        self.layout = layout
+        self.loop = loop
+        self.encoded = False
+        if encoded:
+            self._use_opus()
+        else:
+            self._use_pcm()
+        if self.length == 0:
+            raise ValueError(f"No audio in {source}")
+        self.index = 0  # frames sent
+        self.start = None
+
+    def _use_opus(self):
+        self.encoded = True
+        self.data, self.offsets = _map_opus(cache_opus(self.source, self.settings))
+        self.length = len(self.offsets) - 1  # packets
+
+    def _use_pcm(self):
+        self.encoded = False
+        channels = 1 if self.layout == "mono" else 2
+        self.pcm = _map_pcm(cache_pcm(self.source, self.layout), channels)
+        self.pool = AudioFramePool(OPUS_FRAME, OPUS_RATE, self.layout)
+        self.length = len(self.pcm) // OPUS_FRAME  # frames; a partial last one is dropped
+
+    def negotiate(self, remote):
+        """
+        Given the remote's OpusSettings, keep sending the cached packets
+        only if they are what it asked for; otherwise switch to PCM. Call
+        before the first recv().
+        """
+        if not self.encoded:
+            return
+        wanted = self.settings.merged(remote)
+        if (
+            wanted.max_bitrate != self.settings.max_bitrate
+            or wanted.ptime not in (None, 20)
+            or wanted.dtx
+            or wanted.fec != self.settings.fec
+            or wanted.stereo != self.settings.stereo
+        ):
+            print(f"Media cache: remote asked for {remote}, encoding {self.source} live")
+            self._use_pcm()
+
+    async def _pace(self):
+        clock = asyncio.get_running_loop()
+        if self.start is None:
+            self.start = clock.time()
+        # absolute schedule, so sleeps that overshoot do not add up
+        await asyncio.sleep(max(0.0, self.start + self.index * OPUS_FRAME / OPUS_RATE - clock.time()))
+
+    async def recv(self):
+        if self.readyState != "live" or (not self.loop and self.index >= self.length):
+            self.stop()
+            raise MediaStreamError
+        await self._pace()
+        position = self.index % self.length
+        pts = self.index * OPUS_FRAME
+        self.index += 1
+
+        if self.encoded:
+            packet = av.Packet(self.data[int(self.offsets[position]):int(self.offsets[position + 1])].tobytes())
+            packet.pts = pts
+            packet.time_base = time_base(OPUS_RATE)
+            return packet
+
+        frame, view = self.pool.acquire(pts)
+        view[:] = self.pcm[position * OPUS_FRAME:(position + 1) * OPUS_FRAME]
+        return frame
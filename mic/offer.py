@@ -3,80 +3,72 @@ import aiohttp
 import json
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
 from aiortc.contrib.media import MediaPlayer, MediaStreamTrack
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from av import AudioFrame
-import sounddevice as sd
-import numpy as np
-from queue import Queue, Empty
-import fractions
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from vad import VoiceActivityDetector, comfort_noise
+from mic_capture import MicTrack
 
-class LiveAudioTrack(MediaStreamTrack):
+class LiveAudioTrack(MicTrack):
     """
-    A MediaStreamTrack that captures audio from the microphone
-    in real-time using sounddevice.
+    The microphone as a MediaStreamTrack, read from the shared capture of
+    the device (see mic_capture.py), in 960-sample (20 ms) 48 kHz frames,
+    one Opus frame each.
+
+    With a `vad`, blocks classified as silence are handled according to
+    `silence`: "comfort" sends low level noise, "mute" sends zeros (which
+    Opus DTX reduces to a few bytes) and "skip" drops them, leaving a gap
+    in the timestamps.
     """
 
-    kind = "audio"
-
-    def __init__(self, samplerate=48000, channels=1, blocksize=512, device=None):
-        super().__init__()
-        self.samplerate = samplerate
-        self.channels = channels
-        self.blocksize = blocksize
-        self.queue = Queue()
-        self.pts = 0
-
-        # Open the microphone stream
-        self.stream = sd.InputStream(
-            samplerate=self.samplerate,
-            channels=self.channels,
-            blocksize=self.blocksize,
-            dtype="int16",
-            device=device,  # None = default input
-            callback=self._callback,
-        )
-        self.stream.start()
-
-    def _callback(self, indata, frames, time, status):
-        """
-        Called by sounddevice whenever a new chunk of audio is available.
-        """
-        if status:
-            print("Audio stream status:", status)
-        self.queue.put(indata.copy())
+    def __init__(
+        self,
+        channels=1,
+        device=None,
+        device_samplerate=None,
+        device_channels=None,
+        vad=None,
+        silence="mute",
+    ):
+        if silence not in ("comfort", "mute", "skip"):
+            raise ValueError(f"Unknown silence mode: {silence}")
+        super().__init__(channels, device, device_samplerate, device_channels)
+        self.vad = vad
+        self.silence = silence
 
     async def recv(self):
         """
         Return the next chunk of microphone audio as an AudioFrame.
         """
-        # Wait for audio data to arrive
         while True:
-            try:
-                data = self.queue.get_nowait()
+            data, pts = await self.next_block()
+            if self.vad is None or self.vad.is_speech(data):
                 break
-            except Empty:
-                await asyncio.sleep(0.001)
-
-        # Convert numpy buffer to AudioFrame
-        layout = "mono" if self.channels == 1 else "stereo"
-        frame = AudioFrame(format="s16", layout=layout, samples=data.shape[0])
-        frame.planes[0].update(data.tobytes())
-
-        frame.sample_rate = self.samplerate
-        frame.time_base = fractions.Fraction(1, self.samplerate)
-        frame.pts = self.pts
-        self.pts += data.shape[0]
-
+            if self.silence == "skip":
+                continue
+            if self.silence == "comfort":
+                data = comfort_noise(data.shape)
+            else:
+                data = 0
+            break
+
+        # Copy the block straight into a pooled frame's plane
+        frame, view = self.pool.acquire(pts)
+        view[:] = data
         return frame
 
 SERVER_URL = "http://localhost:8080/offer"
+OPUS_SETTINGS = VOICE
 
 async def run_client():
 
+    install_encoder_hook(OPUS_SETTINGS)
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
 
     data_channel = pc.createDataChannel("chat")
-    mic_track = LiveAudioTrack()
+    mic_track = LiveAudioTrack(vad=VoiceActivityDetector())
     pc.addTrack(mic_track)
     
     # player = MediaPlayer("default", format="pulse")
@@ -117,7 +109,7 @@ async def run_client():
     print(f"Sending offer to server at {SERVER_URL}...")
     try:
         async with aiohttp.ClientSession() as session:
-            payload = {"offer": pc.localDescription.sdp}
+            payload = {"offer": apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)}
             async with session.post(SERVER_URL, json=payload) as response:
                 if response.status == 200:
                     answer_sdp = await response.text()
@@ -142,8 +134,11 @@ async def run_client():
     print("Check the 'Connection state' messages to see the connection progress.")
     await asyncio.sleep(15)
 
+    print("VAD:", mic_track.vad.stats())
+    print("Capture:", mic_track.capture.stats(), "skipped by this track:", mic_track.skipped)
     print("\nClosing peer connection.")
     await pc.close()
+    mic_track.stop()
 
 
 if __name__ == "__main__":
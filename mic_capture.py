@@ -0,0 +1,205 @@
+"""
+One capture stream per microphone, shared by any number of tracks.
+
+Opening an sd.InputStream per track captures the same device several
+times: the conversion runs once per copy, the copies drift apart, and some
+devices refuse the second open. MicCapture opens the device once, at its
+own channel count, and writes each 48 kHz 20 ms block into a ring of
+preallocated blocks. Every MicTrack reading it keeps its own cursor into
+the ring and copies the block into its own frame, mixing it to the track's
+channel count on the way if they differ, so nothing is resampled or queued
+per subscriber.
+
+The PortAudio thread only converts: finished blocks are handed to the event
+loop, which writes them into the ring and advances `written`. Readers run on
+the loop too, so they never see a block half written.
+
+The capture never waits for a subscriber. One that falls more than half the
+ring behind (a stalled peer connection) skips ahead to the newest block and
+leaves a gap in its timestamps; the other subscribers do not notice.
+"""
+import asyncio
+
+import numpy as np
+import sounddevice as sd
+from aiortc.contrib.media import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+from resample import OPUS_FRAME, OPUS_RATE, CaptureConverter, device_blocksize, mix_matrix
+from frame_pool import AudioFramePool
+
+
+class MicCapture:
+    """
+    Capture from `device` converted to 48 kHz, kept in a ring of
+    `capacity` blocks (1 s by default). Use MicCapture.shared() rather than
+    the constructor, so each device is only opened once.
+    """
+
+    _open = {}  # device -> MicCapture
+
+    def __init__(self, device=None, samplerate=None, device_channels=None, capacity=50):
+        info = sd.query_devices(device, "input")
+        if samplerate is None:
+            samplerate = int(info["default_samplerate"])
+        if device_channels is None:
+            device_channels = min(int(info["max_input_channels"]), 2)
+
+        self.device = device
+        self.channels = device_channels
+        self.capacity = capacity
+        self.ring = np.zeros((capacity, OPUS_FRAME, device_channels), dtype=np.int16)
+        self._readonly = self.ring.view()
+        self._readonly.flags.writeable = False
+        self.converter = CaptureConverter(samplerate, device_channels, device_channels)
+
+        self.written = 0  # blocks captured so far; block n lives in ring[n % capacity]
+        self.subscribers = 0
+        self.overruns = 0  # blocks skipped by lagging subscribers, in total
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._ready = self._loop.create_future()
+
+        self.stream = sd.InputStream(
+            samplerate=samplerate,
+            channels=device_channels,
+            blocksize=device_blocksize(samplerate),
+            dtype="int16",
+            device=device,  # None = default input
+            callback=self._callback,
+        )
+        self.stream.start()
+
+    @classmethod
+    def shared(cls, device=None, samplerate=None, device_channels=None):
+        """
+        The open capture of `device`, or a new one. The rate and channel
+        count of an already open device are kept.
+        """
+        if device is None:
+            device = sd.default.device[0]
+        capture = cls._open.get(device)
+        if capture is None:
+            capture = cls._open[device] = cls(device, samplerate, device_channels)
+        return capture
+
+    def _callback(self, indata, frames, time, status):
+        """
+        Called by sounddevice from its own thread for every device block.
+        """
+        if status:
+            print("Audio stream status:", status)
+        # own copies: `indata` is only valid during the callback
+        blocks = [np.array(block) for block in self.converter.process(indata)]
+        if blocks:
+            self._loop.call_soon_threadsafe(self._publish, blocks)
+
+    def _publish(self, blocks):
+        if self.closed:
+            return
+        for block in blocks:
+            self.ring[self.written % self.capacity] = block
+            self.written += 1
+        ready, self._ready = self._ready, self._loop.create_future()
+        ready.set_result(self.written)
+
+    def subscribe(self):
+        """
+        Start reading at the newest block.
+        """
+        self.subscribers += 1
+        return self.written
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+        if self.subscribers == 0:
+            self.close()
+
+    async def read(self, cursor):
+        """
+        Wait for block `cursor` and return (cursor, block). `block` is a
+        read-only view into the ring; copy it before awaiting anything. A
+        cursor more than half the ring behind is moved to the newest block.
+        """
+        while cursor >= self.written:
+            if self.closed:
+                raise MediaStreamError
+            await asyncio.shield(self._ready)
+        lag = self.written - cursor
+        if lag > self.capacity // 2:
+            self.overruns += lag - 1
+            cursor = self.written - 1
+        return cursor, self._readonly[cursor % self.capacity]
+
+    def close(self):
+        self._open.pop(self.device, None)
+        self.closed = True
+        self.stream.stop()
+        self.stream.close()
+        # wake readers so they see the capture has ended
+        if not self._ready.done():
+            self._ready.set_result(self.written)
+
+    def stats(self):
+        return {
+            "device": self.device,
+            "blocks": self.written,
+            "subscribers": self.subscribers,
+            "overruns": self.overruns,
+        }
+
+
+class MicTrack(MediaStreamTrack):
+    """
+    A MediaStreamTrack reading the shared capture of a microphone, as
+    960-sample (20 ms) 48 kHz frames. Any number of tracks may read the
+    same device, each with its own channel count; stopping the last one
+    closes it.
+    """
+
+    kind = "audio"
+
+    def __init__(self, channels=1, device=None, device_samplerate=None, device_channels=None):
+        super().__init__()
+        self.samplerate = OPUS_RATE
+        self.channels = channels
+        self.blocksize = OPUS_FRAME
+        self.capture = MicCapture.shared(device, device_samplerate, device_channels)
+        self.matrix = None
+        if self.capture.channels != channels:
+            self.matrix = mix_matrix(self.capture.channels, channels)
+        self.cursor = self.capture.subscribe()
+        self.first = self.cursor
+        self.skipped = 0  # blocks lost while this track lagged
+        self.pool = AudioFramePool(OPUS_FRAME, OPUS_RATE, "mono" if channels == 1 else "stereo")
+
+    async def next_block(self):
+        """
+        The next captured block, in this track's channels, and its pts.
+        Blocks skipped after a stall advance the pts, so every subscriber
+        stays on the capture clock.
+        """
+        if self.readyState != "live":
+            raise MediaStreamError
+        cursor, block = await self.capture.read(self.cursor)
+        self.skipped += cursor - self.cursor
+        pts = (cursor - self.first) * OPUS_FRAME
+        self.cursor = cursor + 1
+        if self.matrix is not None:
+            block = np.rint(block @ self.matrix).astype(np.int16)
+        return block, pts
+
+    async def recv(self):
+        """
+        Return the next chunk of microphone audio as an AudioFrame.
+        """
+        block, pts = await self.next_block()
+        # Copy the block straight into a pooled frame's plane
+        frame, view = self.pool.acquire(pts)
+        view[:] = block
+        return frame
+
+    def stop(self):
+        if self.readyState == "live":
+            self.capture.unsubscribe()
+        super().stop()
@@ -3,19 +3,26 @@ import asyncio
 import aiohttp
 import json
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
-from aiortc.contrib.media import MediaPlayer, MediaStreamTrack
+from aiortc.contrib.media import MediaStreamTrack
+
+from opus_settings import MUSIC, apply_to_sdp, install_encoder_hook
+from ice_restart import IceRestart, RestartMonitor
+from media_cache import CachedAudioTrack
 
 SERVER_URL = "http://localhost:8080/offer"
+RESTART_URL = "http://localhost:8080/restart"
+OPUS_SETTINGS = MUSIC
+# Decoded and encoded once into the media cache, then shared by every run.
+MUSIC_FILE = "/home/shrubex/Music/music1.mp3"
 
 async def run_client():
 
+    install_encoder_hook(OPUS_SETTINGS)
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
 
     data_channel = pc.createDataChannel("chat")
-    player = MediaPlayer("/home/shrubex/Music/music1.mp3")
-    if player.audio:
-        pc.addTrack(player.audio)
-        print("✅ Audio track added")
+    pc.addTrack(CachedAudioTrack(MUSIC_FILE, settings=OPUS_SETTINGS))
+    print("✅ Audio track added")
     
     @data_channel.on("open")
     def on_open():
@@ -49,10 +56,11 @@ async def run_client():
     print(f"Sending offer to server at {SERVER_URL}...")
     try:
         async with aiohttp.ClientSession() as session:
-            payload = {"offer": pc.localDescription.sdp}
+            payload = {"offer": apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)}
             async with session.post(SERVER_URL, json=payload) as response:
                 if response.status == 200:
                     answer_sdp = await response.text()
+                    session_token = response.headers.get("X-Session-Token")
                     print("Received answer from server.")
                     
                     # 4. Set the remote description with the server's answer
@@ -69,12 +77,35 @@ async def run_client():
         await pc.close()
         return
 
+    # Renegotiate only the transport when the network changes or stalls.
+    # We only receive RTCP from the server, hence the generous stall timeout.
+    async def restart_ice():
+        async with await IceRestart.create(pc) as ice_restart:
+            async with aiohttp.ClientSession() as session:
+                payload = {"session": session_token, "ice": ice_restart.local_parameters()}
+                async with session.post(RESTART_URL, json=payload) as response:
+                    if response.status != 200:
+                        await ice_restart.close()
+                        # the server throttles restarts; don't spend the next attempt too early
+                        await asyncio.sleep(float(response.headers.get("Retry-After", 0)))
+                        response.raise_for_status()
+                    remote = await response.json()
+            return await ice_restart.complete(remote["ice"])
+
+    monitor = None
+    if session_token:
+        monitor = RestartMonitor(pc, restart_ice, stall_timeout=3.0)
+        monitor.start()
+
     # Keep the connection alive to observe state changes
     print("\nConnection handshake complete. Keeping the script alive for 30 seconds.")
     print("Check the 'Connection state' messages to see the connection progress.")
     await asyncio.sleep(30)
 
     print("\nClosing peer connection.")
+    if monitor is not None:
+        print("ICE restart recoveries (s):", monitor.recoveries)
+        monitor.stop()
     await pc.close()
 
 
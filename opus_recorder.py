@@ -0,0 +1,258 @@
+"""
+Record received Opus as is, without decoding.
+
+MediaRecorder decodes every received packet to PCM and writes WAV: a decode
+per packet and ~1.5 MB per minute of call. OpusRecorder takes the encoded
+frames from the receiver after its jitter buffer (so they are in order),
+never starts decoding them, and muxes them straight into Ogg or WebM: the
+CPU cost is a file write and the file is the size of the wire stream.
+Playback decodes on demand (ffplay, browsers, or `decode()` below).
+
+Timestamps come from RTP. Where packets are missing (loss, DTX, an ICE
+restart) the gap is filled with empty Opus frames, which decoders conceal
+like a live receiver would, so the file keeps the timing of the call.
+
+This taps aiortc internals (the receiver's decoder queue), like
+ice_restart.py does for aioice. Nothing reads the received track, so its
+"ended" event never fires; instead the file is finalized when every
+recorded receiver has stopped (pc.close(), a lost transport), or on stop().
+"""
+import fractions
+import struct
+
+import av
+from aiortc.contrib.media import MediaRecorder
+
+SAMPLE_RATE = 48000
+TIME_BASE = fractions.Fraction(1, SAMPLE_RATE)
+
+# CELT fullband frame durations (RFC 6716 table 2) and, per config, the
+# TOC-only packet of that duration: an empty frame, decoded as a lost one.
+GAP_PACKETS = [(960, b"\xf8"), (480, b"\xf0"), (240, b"\xe8"), (120, b"\xe0")]
+
+# Beyond this the sender has restarted its clock; don't write minutes of gap.
+MAX_GAP = 60 * SAMPLE_RATE
+
+CONTAINERS = {".ogg": "ogg", ".opus": "ogg", ".webm": "webm", ".mka": "matroska"}
+
+
+def opus_packet_samples(data):
+    """
+    Duration of an Opus packet in 48 kHz samples, from its TOC byte.
+    """
+    if not data:
+        return 0
+    config = data[0] >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]
+    elif config < 16:
+        frame = (480, 960)[config % 2]
+    else:
+        frame = (120, 240, 480, 960)[config % 4]
+    code = data[0] & 3
+    if code == 0:
+        count = 1
+    elif code < 3:
+        count = 2
+    else:
+        count = data[1] & 0x3F if len(data) > 1 else 0
+    return frame * count
+
+
+def opus_head(channels=2):
+    """
+    OpusHead identification header (RFC 7845) for the container.
+    """
+    return b"OpusHead" + struct.pack("<BBHIhB", 1, channels, 0, SAMPLE_RATE, 0, 0)
+
+
+class _DecoderQueueTap:
+    """
+    Stands in for RTCRtpReceiver's decoder queue: Opus frames go to the
+    recorder, everything else to the decoder. The end-of-stream None the
+    receiver puts when it stops also goes to `ended`.
+    """
+
+    def __init__(self, queue, write, ended):
+        self.queue = queue
+        self.write = write
+        self.ended = ended
+
+    def put(self, item):
+        if item is not None and self.write is not None and item[0].name.lower() == "opus":
+            self.write(item[1])
+            return
+        self.queue.put(item)
+        if item is None:
+            self.ended(self)
+
+    def get(self, *args, **kwargs):
+        return self.queue.get(*args, **kwargs)
+
+
+class _RecordedStream:
+    def __init__(self, stream):
+        self.stream = stream
+        self.origin = None
+        self.next_pts = 0
+        self.packets = 0
+        self.bytes = 0
+        self.concealed = 0  # samples
+        self.dropped = 0
+
+
+class OpusRecorder:
+    """
+    Drop-in for MediaRecorder on received audio tracks of `pc`: addTrack(),
+    start() and stop(). The container follows the file extension (.ogg,
+    .opus, .webm, .mka) unless `format` is given.
+    """
+
+    def __init__(self, file, pc, format=None):
+        self.file = file
+        self.pc = pc
+        self.format = format or CONTAINERS.get(file[file.rfind("."):].lower(), "ogg")
+        self.container = None
+        self._tracks = []  # (track, receiver)
+        self._streams = []
+        self._taps = []
+
+    def _receiver(self, track):
+        for receiver in self.pc.getReceivers():
+            if receiver.track is track:
+                return receiver
+        raise ValueError("Track is not received by this peer connection")
+
+    def addTrack(self, track):
+        if track.kind != "audio":
+            return
+        self._tracks.append((track, self._receiver(track)))
+
+    async def start(self):
+        if self.container is not None:
+            return
+        self.container = av.open(self.file, "w", format=self.format)
+        for track, receiver in self._tracks:
+            stream = self.container.add_stream("libopus", rate=SAMPLE_RATE)
+            # WebRTC always negotiates opus/48000/2; mono packets decode fine
+            stream.codec_context.layout = "stereo"
+            stream.codec_context.extradata = opus_head(2)
+            recorded = _RecordedStream(stream)
+            self._streams.append(recorded)
+
+            name = "_RTCRtpReceiver__decoder_queue"
+            tap = _DecoderQueueTap(getattr(receiver, name), lambda frame, r=recorded: self._write(r, frame), self._tap_ended)
+            setattr(receiver, name, tap)
+            self._taps.append(tap)
+
+    def _mux(self, recorded, data, pts):
+        duration = opus_packet_samples(data)
+        packet = av.Packet(data)
+        packet.stream = recorded.stream
+        packet.pts = packet.dts = pts
+        packet.time_base = TIME_BASE
+        packet.duration = duration
+        # mux() rebases the packet to the stream's time base in place
+        self.container.mux(packet)
+        return duration
+
+    def _write(self, recorded, frame):
+        if recorded.origin is None:
+            recorded.origin = frame.timestamp
+        pts = frame.timestamp - recorded.origin
+        if pts < recorded.next_pts:
+            # duplicate or too late for the jitter buffer
+            recorded.dropped += 1
+            return
+
+        gap = pts - recorded.next_pts
+        if gap > MAX_GAP:
+            print(f"Recorder: {gap / SAMPLE_RATE:.0f}s timestamp jump, not padded")
+            recorded.origin += gap
+            pts = recorded.next_pts
+        else:
+            for size, empty in GAP_PACKETS:
+                while gap >= size:
+                    self._mux(recorded, empty, recorded.next_pts)
+                    recorded.next_pts += size
+                    recorded.concealed += size
+                    gap -= size
+            # a remainder under 2.5 ms cannot be expressed; absorb it
+            recorded.origin += gap
+            pts -= gap
+
+        duration = self._mux(recorded, frame.data, pts)
+        recorded.next_pts = pts + duration
+        recorded.packets += 1
+        recorded.bytes += len(frame.data)
+
+    def _tap_ended(self, tap):
+        # called on the event loop by RTCRtpReceiver.stop(); finish the file
+        # right away, the caller may be about to leave the loop
+        tap.write = None
+        if all(t.write is None for t in self._taps):
+            self._close()
+
+    async def stop(self):
+        self._close()
+
+    def _close(self):
+        if self.container is None:
+            return
+        for tap in self._taps:
+            # frames arriving from now on are decoded as usual
+            tap.write = None
+        self.container.close()
+        self.container = None
+        for recorded in self._streams:
+            print(
+                f"Recorded {recorded.packets} Opus packets ({recorded.bytes / 1000:.1f} kB, "
+                f"{recorded.next_pts / SAMPLE_RATE:.1f}s, {recorded.concealed / SAMPLE_RATE:.1f}s concealed) to {self.file}"
+            )
+
+    def stats(self):
+        return [
+            {
+                "packets": r.packets,
+                "bytes": r.bytes,
+                "seconds": r.next_pts / SAMPLE_RATE,
+                "concealed_seconds": r.concealed / SAMPLE_RATE,
+                "dropped": r.dropped,
+            }
+            for r in self._streams
+        ]
+
+
+def recorder_for(file, pc):
+    """
+    OpusRecorder for compressed containers, MediaRecorder (decoded) otherwise.
+    """
+    if file[file.rfind("."):].lower() in CONTAINERS:
+        return OpusRecorder(file, pc)
+    return MediaRecorder(file)
+
+
+def decode(src, dst):
+    """
+    Decode a recording to 16-bit stereo WAV, for tools that need PCM.
+    """
+    with av.open(src) as source, av.open(dst, "w") as output:
+        audio = source.streams.audio[0]
+        decoder = av.CodecContext.create("libopus", "r")
+        decoder.extradata = audio.codec_context.extradata
+        out = output.add_stream("pcm_s16le", rate=SAMPLE_RATE, layout="stereo")
+        resampler = av.AudioResampler(format="s16", layout="stereo", rate=SAMPLE_RATE)
+        for packet in source.demux(audio):
+            for frame in decoder.decode(packet):
+                for resampled in resampler.resample(frame):
+                    output.mux(out.encode(resampled))
+        output.mux(out.encode(None))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("usage: python opus_recorder.py <recording.ogg> <output.wav>")
+        sys.exit(1)
+    decode(sys.argv[1], sys.argv[2])
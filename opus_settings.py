@@ -0,0 +1,369 @@
+"""
+Opus encoding parameters negotiated through SDP.
+
+Each side advertises how it wants to *receive* Opus in the fmtp line of its
+description (RFC 7587): maxaveragebitrate, useinbandfec, usedtx, stereo and
+a=ptime. The sending side honours the remote fmtp when aiortc creates its
+encoder: the remote bitrate is a ceiling on the local one, and the rest are
+the receiver's preferences, so they override the local defaults.
+
+aiortc negotiates codecs by copying its own, so the remote fmtp never
+reaches the encoder through the codec parameters. install_encoder_hook()
+therefore reads each audio section of the remote description itself and
+attaches the result to that transceiver's Opus codec.
+"""
+import re
+
+OPUS_MIME = "audio/opus"
+OPUS_RTPMAP = re.compile(r"^a=rtpmap:(\d+) opus/48000", re.IGNORECASE)
+FMTP = re.compile(r"^a=fmtp:(\d+) ?(.*)$")
+PTIME = re.compile(r"^a=ptime:(\d+)")
+MID = re.compile(r"^a=mid:(\S+)")
+
+
+class OpusSettings:
+    """
+    Opus parameters for one side of a call. None means "leave aiortc's
+    default alone".
+    """
+
+    def __init__(self, max_bitrate=None, ptime=None, fec=None, dtx=None, stereo=None):
+        self.max_bitrate = max_bitrate
+        self.ptime = ptime
+        self.fec = fec
+        self.dtx = dtx
+        self.stereo = stereo
+
+    def __repr__(self):
+        return (
+            f"OpusSettings(max_bitrate={self.max_bitrate}, ptime={self.ptime}, "
+            f"fec={self.fec}, dtx={self.dtx}, stereo={self.stereo})"
+        )
+
+    def fmtp(self):
+        """
+        Return the fmtp parameters advertising these settings.
+        """
+        params = {}
+        if self.max_bitrate is not None:
+            params["maxaveragebitrate"] = int(self.max_bitrate)
+        if self.fec is not None:
+            params["useinbandfec"] = int(bool(self.fec))
+        if self.dtx is not None:
+            params["usedtx"] = int(bool(self.dtx))
+        if self.stereo is not None:
+            params["stereo"] = int(bool(self.stereo))
+            params["sprop-stereo"] = int(bool(self.stereo))
+        return params
+
+    @classmethod
+    def from_fmtp(cls, parameters, ptime=None):
+        """
+        Build settings from Opus fmtp parameters and the a=ptime of the
+        same media section.
+        """
+        def flag(name):
+            value = parameters.get(name)
+            return None if value is None else bool(int(value))
+
+        bitrate = parameters.get("maxaveragebitrate")
+        return cls(
+            max_bitrate=None if bitrate is None else int(bitrate),
+            ptime=None if ptime is None else int(ptime),
+            fec=flag("useinbandfec"),
+            dtx=flag("usedtx"),
+            stereo=flag("stereo"),
+        )
+
+    def merged(self, remote):
+        """
+        Combine local settings with what the remote asked for. The lower
+        bitrate wins; ptime, FEC, DTX and stereo are receive preferences
+        (RFC 7587), so a remote value wins and a local one is the default.
+        """
+        bitrates = [b for b in (self.max_bitrate, remote.max_bitrate) if b is not None]
+
+        def pick(local, other):
+            return local if other is None else other
+
+        return OpusSettings(
+            max_bitrate=min(bitrates) if bitrates else None,
+            ptime=pick(self.ptime, remote.ptime),
+            fec=pick(self.fec, remote.fec),
+            dtx=pick(self.dtx, remote.dtx),
+            stereo=pick(self.stereo, remote.stereo),
+        )
+
+
+# Speech over metered links: DTX drops silent frames to a few bytes.
+VOICE = OpusSettings(max_bitrate=24000, ptime=20, fec=True, dtx=True, stereo=False)
+# Low-bandwidth speech, e.g. a field unit on 2G.
+NARROW_VOICE = OpusSettings(max_bitrate=12000, ptime=40, fec=True, dtx=True, stereo=False)
+# Music (hold music, the MP3 player in offer.py).
+MUSIC = OpusSettings(max_bitrate=96000, ptime=20, fec=False, dtx=False, stereo=True)
+
+
+def _format_fmtp(payload_type, params):
+    body = ";".join(f"{key}={value}" for key, value in params.items())
+    return f"a=fmtp:{payload_type} {body}"
+
+
+def _parse_fmtp(body):
+    params = {}
+    for item in body.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, value = item.partition("=")
+        params[key] = value
+    return params
+
+
+def remote_settings(sdp):
+    """
+    OpusSettings requested by each audio section of `sdp`, keyed by mid.
+    """
+    settings = {}
+    eol = "\r\n" if "\r\n" in sdp else "\n"
+    sections = []
+    for line in sdp.split(eol):
+        if line.startswith("m="):
+            sections.append([])
+        if sections:
+            sections[-1].append(line)
+
+    for section in sections:
+        if not section[0].startswith("m=audio"):
+            continue
+        mid = None
+        ptime = None
+        opus = None
+        fmtp = {}
+        for line in section:
+            if OPUS_RTPMAP.match(line) and opus is None:
+                opus = OPUS_RTPMAP.match(line).group(1)
+            elif FMTP.match(line):
+                match = FMTP.match(line)
+                fmtp[match.group(1)] = _parse_fmtp(match.group(2))
+            elif PTIME.match(line):
+                ptime = PTIME.match(line).group(1)
+            elif MID.match(line):
+                mid = MID.match(line).group(1)
+        if opus is not None:
+            settings[mid] = OpusSettings.from_fmtp(fmtp.get(opus, {}), ptime)
+    return settings
+
+
+def apply_to_sdp(sdp, settings):
+    """
+    Rewrite the Opus fmtp and ptime lines of every audio section of `sdp`.
+    """
+    params = settings.fmtp()
+    if not params and settings.ptime is None:
+        return sdp
+
+    eol = "\r\n" if "\r\n" in sdp else "\n"
+    lines = sdp.split(eol)
+    payload_types = set()
+    for line in lines:
+        match = OPUS_RTPMAP.match(line)
+        if match:
+            payload_types.add(match.group(1))
+    if not payload_types:
+        return sdp
+
+    out = []
+    section = []
+    audio = False
+
+    def flush():
+        if audio:
+            out.extend(_rewrite_audio_section(section, payload_types, params, settings.ptime))
+        else:
+            out.extend(section)
+
+    for line in lines:
+        if line.startswith("m="):
+            flush()
+            section = []
+            audio = line.startswith("m=audio")
+        section.append(line)
+    flush()
+    return eol.join(out)
+
+
+def _rewrite_audio_section(lines, payload_types, params, ptime):
+    # keep the trailing empty string (from the final CRLF) at the very end
+    tail = []
+    while lines and lines[-1] == "":
+        tail.append(lines.pop())
+
+    with_fmtp = set()
+    for line in lines:
+        match = FMTP.match(line)
+        if match and match.group(1) in payload_types:
+            with_fmtp.add(match.group(1))
+
+    out = []
+    for line in lines:
+        if ptime is not None and (line.startswith("a=ptime:") or line.startswith("a=maxptime:")):
+            continue
+        match = FMTP.match(line)
+        if match and match.group(1) in payload_types:
+            merged = _parse_fmtp(match.group(2))
+            merged.update(params)
+            out.append(_format_fmtp(match.group(1), merged))
+            continue
+        out.append(line)
+        rtpmap = OPUS_RTPMAP.match(line)
+        if rtpmap and params and rtpmap.group(1) not in with_fmtp:
+            out.append(_format_fmtp(rtpmap.group(1), params))
+    if ptime is not None:
+        out.append(f"a=ptime:{int(ptime)}")
+    return out + tail
+
+
+def configure_codec(codec, settings):
+    """
+    Apply settings to a libopus av.CodecContext before it is opened.
+    `stereo` sets the channel layout, which the encoder's resampler must
+    then match (see _set_layout).
+
+    FFmpeg's libopus wrapper has no DTX option; DTX is done by DtxGate.
+    """
+    if settings.max_bitrate is not None:
+        codec.bit_rate = int(settings.max_bitrate)
+    options = dict(codec.options or {})
+    if settings.fec is not None:
+        options["fec"] = "1" if settings.fec else "0"
+        if settings.fec:
+            # libopus only spends bits on FEC when it expects loss
+            options.setdefault("packet_loss", "10")
+    if settings.ptime is not None:
+        options["frame_duration"] = str(int(settings.ptime))
+    if settings.stereo is not None:
+        codec.layout = "stereo" if settings.stereo else "mono"
+    codec.options = options
+
+
+def _set_layout(encoder):
+    """
+    Resample into the codec's layout; aiortc's encoder always makes stereo.
+    """
+    from av import AudioResampler
+
+    resampler = encoder.resampler
+    encoder.resampler = AudioResampler(
+        format="s16",
+        layout=encoder.codec.layout.name,
+        rate=resampler.rate,
+        frame_size=resampler.frame_size,
+    )
+
+
+class DtxGate:
+    """
+    Discontinuous transmission in front of the encoder.
+
+    After `hangover` consecutive silent frames only every `keepalive`-th
+    frame is sent (400 ms at 20 ms frames, like WebRTC), so the far end
+    keeps its comfort noise going while the link carries almost nothing.
+    """
+
+    def __init__(self, threshold_dbfs=-60.0, hangover=10, keepalive=20):
+        # numpy only once DTX is actually used; answer servers start faster
+        import numpy
+
+        self._np = numpy
+        self.threshold = 32768.0 * 10 ** (threshold_dbfs / 20)
+        self.hangover = hangover
+        self.keepalive = keepalive
+        self.silent_frames = 0
+        self.suppressed = 0
+
+    def should_send(self, samples):
+        np = self._np
+        samples = np.asarray(samples, dtype=np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+        if rms >= self.threshold:
+            self.silent_frames = 0
+            return True
+        self.silent_frames += 1
+        if self.silent_frames <= self.hangover:
+            return True
+        if (self.silent_frames - self.hangover) % self.keepalive == 0:
+            return True
+        self.suppressed += 1
+        return False
+
+
+def _wrap_dtx(encoder):
+    gate = DtxGate()
+    encode = encoder.encode
+
+    def encode_with_dtx(frame, force_keyframe=False):
+        payloads, timestamp = encode(frame, force_keyframe)
+        if payloads and not gate.should_send(frame.to_ndarray()):
+            return [], None
+        return payloads, timestamp
+
+    encoder.encode = encode_with_dtx
+    encoder.dtx = gate
+
+
+_local_settings = OpusSettings()
+
+
+def install_encoder_hook(local=None):
+    """
+    Make aiortc's Opus encoders honour the negotiated fmtp parameters.
+
+    setRemoteDescription() tags each audio transceiver's Opus codec with
+    what the remote section asked for; aiortc later creates the encoder
+    lazily from that codec. A sender track with a negotiate() method is
+    handed the remote's settings as well. Calling this again only replaces the local
+    settings.
+    """
+    global _local_settings
+    _local_settings = local or OpusSettings()
+
+    import aiortc.rtcrtpsender as rtcrtpsender
+    from aiortc import RTCPeerConnection
+
+    if getattr(rtcrtpsender.get_encoder, "opus_settings_hook", False):
+        return
+    original = rtcrtpsender.get_encoder
+    set_remote = RTCPeerConnection.setRemoteDescription
+
+    async def setRemoteDescription(self, sessionDescription):
+        await set_remote(self, sessionDescription)
+        requested = remote_settings(sessionDescription.sdp)
+        for transceiver in self.getTransceivers():
+            if transceiver.mid not in requested:
+                continue
+            # the codecs sender.send() will be given, see find_common_codecs
+            for codec in transceiver._codecs:
+                if codec.mimeType.lower() == OPUS_MIME:
+                    codec.remote_opus = requested[transceiver.mid]
+            # tracks sending pre-encoded Opus (media_cache.CachedAudioTrack)
+            # bypass the encoder, so they are told themselves
+            track = transceiver.sender.track
+            if hasattr(track, "negotiate"):
+                track.negotiate(requested[transceiver.mid])
+
+    def get_encoder(codec):
+        encoder = original(codec)
+        if codec.mimeType.lower() == OPUS_MIME and hasattr(encoder, "codec"):
+            settings = _local_settings.merged(getattr(codec, "remote_opus", None) or OpusSettings())
+            configure_codec(encoder.codec, settings)
+            if settings.stereo is not None:
+                _set_layout(encoder)
+            # libopus consumes the options on open; keep what was applied
+            encoder.opus_settings = settings
+            if settings.dtx:
+                _wrap_dtx(encoder)
+        return encoder
+
+    get_encoder.opus_settings_hook = True
+    rtcrtpsender.get_encoder = get_encoder
+    RTCPeerConnection.setRemoteDescription = setRemoteDescription
@@ -0,0 +1,199 @@
+"""
+Registry of live peer connections for the answering servers.
+
+Every RTCPeerConnection (and its MediaRecorder) created by /offer is added
+here and closed when it goes idle, outlives `max_duration`, stays
+disconnected longer than `disconnect_grace`, or the server shuts down.
+"""
+import asyncio
+import itertools
+import os
+import resource
+import secrets
+import time
+
+
+def rss_bytes():
+    """
+    Current resident set size; falls back to the peak on non-Linux.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeerSession:
+    def __init__(self, session_id, pc, recorder=None, label=None):
+        self.id = session_id
+        # handed to the client for follow-up requests such as ICE restarts
+        self.token = secrets.token_urlsafe(16)
+        self.pc = pc
+        self.recorder = recorder
+        self.label = label
+        self.created = time.monotonic()
+        self.last_activity = self.created
+        self.bytes_received = 0
+        self.closing = None
+        self._grace_task = None
+        # ICE restart completing in the background, and when the last began
+        self.restart_task = None
+        self.last_restart = None
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def info(self):
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "label": self.label,
+            "state": self.pc.connectionState,
+            "age": round(now - self.created, 1),
+            "idle": round(now - self.last_activity, 1),
+            "bytes_received": self.bytes_received,
+        }
+
+
+class PeerRegistry:
+    def __init__(self, idle_timeout=60.0, max_duration=4 * 3600.0, disconnect_grace=10.0, reap_interval=5.0):
+        self.idle_timeout = idle_timeout
+        self.max_duration = max_duration
+        self.disconnect_grace = disconnect_grace
+        self.reap_interval = reap_interval
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._reaper = None
+        self._baseline_rss = rss_bytes()
+
+        # metrics
+        self.closed = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def by_token(self, token):
+        for session in self.sessions.values():
+            if secrets.compare_digest(session.token, token):
+                return session
+        return None
+
+    def add(self, pc, recorder=None, label=None):
+        """
+        Track `pc` until it is closed. Returns its PeerSession.
+        """
+        session = PeerSession(next(self._ids), pc, recorder, label)
+        self.sessions[session.id] = session
+
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            state = pc.connectionState
+            if state == "disconnected":
+                if session._grace_task is None:
+                    session._grace_task = asyncio.ensure_future(self._close_after_grace(session))
+            elif state == "connected":
+                if session._grace_task is not None:
+                    session._grace_task.cancel()
+                    session._grace_task = None
+                session.touch()
+            elif state in ("failed", "closed"):
+                await self.close(session, state)
+
+        return session
+
+    async def _close_after_grace(self, session):
+        await asyncio.sleep(self.disconnect_grace)
+        session._grace_task = None
+        await self.close(session, "disconnected")
+
+    async def close(self, session, reason):
+        """
+        Stop the recorder and close the connection; safe to call repeatedly.
+        """
+        if session.closing is None:
+            session.closing = asyncio.ensure_future(self._close(session, reason))
+        await asyncio.shield(session.closing)
+
+    async def _close(self, session, reason):
+        print(f"Closing peer {session.id} ({reason})")
+        self.sessions.pop(session.id, None)
+        self.closed[reason] = self.closed.get(reason, 0) + 1
+        if session._grace_task is not None:
+            session._grace_task.cancel()
+        if session.restart_task is not None:
+            session.restart_task.cancel()
+        if session.recorder is not None:
+            try:
+                await session.recorder.stop()
+            except Exception as e:
+                print(f"Recorder for peer {session.id} failed to stop: {e}")
+        await session.pc.close()
+
+    async def _update_activity(self, session):
+        """
+        Count received RTP / transport bytes as activity. aiortc reports no
+        stats for data-channel-only peers; their message handlers call
+        touch() instead.
+        """
+        received = 0
+        stats = await session.pc.getStats()
+        for report in stats.values():
+            if report.type == "inbound-rtp":
+                received += getattr(report, "bytesReceived", 0) or 0
+            elif report.type == "transport":
+                received += getattr(report, "bytesReceived", 0) or 0
+        if received != session.bytes_received:
+            session.bytes_received = received
+            session.touch()
+
+    async def reap(self):
+        """
+        Close every session that is idle or has exceeded max_duration.
+        """
+        now = time.monotonic()
+        expired = []
+        for session in list(self.sessions.values()):
+            try:
+                await self._update_activity(session)
+            except Exception:
+                pass
+            if now - session.created > self.max_duration:
+                expired.append((session, "max_duration"))
+            elif now - session.last_activity > self.idle_timeout:
+                expired.append((session, "idle"))
+        await asyncio.gather(*(self.close(session, reason) for session, reason in expired))
+
+    async def _run_reaper(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                print("Peer reaper error:", e)
+
+    async def close_all(self, reason="shutdown"):
+        await asyncio.gather(*(self.close(session, reason) for session in list(self.sessions.values())))
+
+    def gauges(self):
+        rss = rss_bytes()
+        peers = len(self.sessions)
+        return {
+            "peers": peers,
+            "rss_bytes": rss,
+            "rss_bytes_per_peer": (rss - self._baseline_rss) // peers if peers else 0,
+            "closed": dict(self.closed),
+        }
+
+    # aiohttp application hooks
+
+    async def on_startup(self, app):
+        self._baseline_rss = rss_bytes()
+        self._reaper = asyncio.ensure_future(self._run_reaper())
+
+    async def on_shutdown(self, app):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        await self.close_all()
@@ -0,0 +1,234 @@
+"""
+Room-scoped publish/subscribe over the peers' "chat" data channels.
+
+A peer sends JSON text on its channel to join, leave or publish to a topic
+(a room); a published message goes to every other peer in that topic:
+
+    {"op": "join", "topic": "lobby"}
+    {"op": "publish", "topic": "lobby", "data": "hello"}
+    {"op": "leave", "topic": "lobby"}
+
+Subscribers receive
+
+    {"op": "message", "topic": "lobby", "from": 3, "seq": 17, "ts": 1700000000.123, "data": "hello"}
+
+where `ts` is the server's time.time() at publish. Errors come back as
+{"op": "error", "reason": ...}. Other text is not ours to handle.
+
+Fan-out costs one JSON encode per message, whatever the audience: the
+UTF-8 bytes are handed to every subscriber's SCTP queue as they are (this
+taps aiortc internals, like ice_restart.py does for aioice). Each
+subscriber sends straight away while its channel's bufferedAmount is under
+`high_water`, then queues up to `max_queue` messages and drops the oldest
+beyond that, so a slow peer loses backlog instead of growing the server's
+memory or holding up the room.
+"""
+import asyncio
+import collections
+import json
+import time
+
+from aiortc.rtcsctptransport import WEBRTC_STRING
+
+MAX_QUEUE = 256  # messages per subscriber
+HIGH_WATER = 256 * 1024  # bytes buffered in a channel before queueing
+MAX_MESSAGE = 16 * 1024  # the safe SCTP message size between browsers
+LATENCY_SAMPLES = 1000
+ENDED_TOPICS = 100  # final stats kept for topics whose last subscriber left
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode("utf8")
+
+
+def send_encoded(channel, data):
+    """
+    channel.send() of a text message already encoded as UTF-8.
+    """
+    transport = channel.transport
+    channel._addBufferedAmount(len(data))
+    transport._data_channel_queue.append((channel, WEBRTC_STRING, data))
+    asyncio.ensure_future(transport._data_channel_flush())
+
+
+class Topic:
+    def __init__(self, name):
+        self.name = name
+        self.subscribers = set()
+        self.seq = 0
+        self.created = time.monotonic()
+
+        # metrics
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.bytes_out = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)  # publish to send, seconds
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.created, 1e-9)
+        stats = {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "messages_per_s": round(self.delivered / elapsed, 1),
+            "bytes_per_s": round(self.bytes_out / elapsed),
+        }
+        if self.latencies:
+            # no numpy here: answer.py keeps it out of its startup
+            ms = sorted(x * 1000 for x in self.latencies)
+            stats["queue_p50_ms"] = round(ms[len(ms) // 2], 2)
+            stats["queue_p95_ms"] = round(ms[int(len(ms) * 0.95)], 2)
+            stats["queue_max_ms"] = round(ms[-1], 2)
+        return stats
+
+
+class Subscriber:
+    """
+    One peer's chat channel and its outgoing queue.
+    """
+
+    def __init__(self, channel, peer_id, max_queue=MAX_QUEUE, high_water=HIGH_WATER):
+        self.channel = channel
+        self.peer_id = peer_id
+        self.max_queue = max_queue
+        self.high_water = high_water
+        self.topics = set()
+        self.queue = collections.deque()  # (topic, data, published)
+        self.delivered = 0
+        self.dropped = 0
+        channel.bufferedAmountLowThreshold = high_water // 2
+        channel.on("bufferedamountlow", self.flush)
+
+    def offer(self, topic, data, published):
+        if not self.queue and self.channel.bufferedAmount < self.high_water:
+            self._send(topic, data, published)
+            return
+        if len(self.queue) >= self.max_queue:
+            # slow consumer: the oldest message goes
+            old_topic, _, _ = self.queue.popleft()
+            old_topic.dropped += 1
+            self.dropped += 1
+        self.queue.append((topic, data, published))
+
+    def flush(self):
+        while self.queue and self.channel.bufferedAmount < self.high_water:
+            self._send(*self.queue.popleft())
+
+    def _send(self, topic, data, published):
+        if self.channel.readyState != "open":
+            topic.dropped += 1
+            self.dropped += 1
+            return
+        send_encoded(self.channel, data)
+        self.delivered += 1
+        topic.delivered += 1
+        topic.bytes_out += len(data)
+        topic.latencies.append(time.monotonic() - published)
+
+    def reply(self, message):
+        if self.channel.readyState == "open":
+            send_encoded(self.channel, encode(message))
+
+
+class PubSub:
+    def __init__(self, max_topics=1000, max_queue=MAX_QUEUE, high_water=HIGH_WATER, max_ended=ENDED_TOPICS):
+        self.max_topics = max_topics
+        self.max_queue = max_queue
+        self.high_water = high_water
+        self.max_ended = max_ended
+        self.topics = {}
+        self.ended = collections.OrderedDict()  # name -> final stats, oldest first
+
+    def subscriber(self, channel, peer_id):
+        """
+        A Subscriber for `channel`; leaves every topic when the channel closes.
+        """
+        subscriber = Subscriber(channel, peer_id, self.max_queue, self.high_water)
+        channel.on("close", lambda: self.disconnect(subscriber))
+        return subscriber
+
+    def handle(self, subscriber, message):
+        """
+        Act on a message received from `subscriber`. Returns False if it is
+        not a pub/sub request.
+        """
+        if not isinstance(message, str) or not message.startswith("{"):
+            return False
+        try:
+            request = json.loads(message)
+            op = request["op"]
+            name = request["topic"]
+        except (ValueError, TypeError, KeyError):
+            return False
+        if not isinstance(name, str) or not name:
+            subscriber.reply({"op": "error", "reason": "invalid topic"})
+        elif op == "join":
+            self.join(subscriber, name)
+        elif op == "leave":
+            self.leave(subscriber, name)
+        elif op == "publish":
+            self.publish(subscriber, name, request.get("data"))
+        else:
+            subscriber.reply({"op": "error", "reason": f"unknown op {op!r}"})
+        return True
+
+    def join(self, subscriber, name):
+        topic = self.topics.get(name)
+        if topic is None:
+            if len(self.topics) >= self.max_topics:
+                subscriber.reply({"op": "error", "topic": name, "reason": "too many topics"})
+                return
+            topic = self.topics[name] = Topic(name)
+        topic.subscribers.add(subscriber)
+        subscriber.topics.add(topic)
+
+    def leave(self, subscriber, name):
+        topic = self.topics.get(name)
+        if topic is None or topic not in subscriber.topics:
+            return
+        topic.subscribers.discard(subscriber)
+        subscriber.topics.discard(topic)
+        if not topic.subscribers:
+            del self.topics[name]
+            # a topic of the same name may come and go again; keep the latest
+            self.ended.pop(name, None)
+            self.ended[name] = topic.stats()
+            while len(self.ended) > self.max_ended:
+                self.ended.popitem(last=False)
+
+    def disconnect(self, subscriber):
+        # whatever is still queued will never be sent
+        for topic, _, _ in subscriber.queue:
+            topic.dropped += 1
+            subscriber.dropped += 1
+        subscriber.queue.clear()
+        for topic in list(subscriber.topics):
+            self.leave(subscriber, topic.name)
+
+    def publish(self, subscriber, name, data):
+        topic = self.topics.get(name)
+        if topic is None or topic not in subscriber.topics:
+            subscriber.reply({"op": "error", "topic": name, "reason": "not joined"})
+            return
+        encoded = encode({"op": "message", "topic": name, "from": subscriber.peer_id, "seq": topic.seq + 1, "ts": time.time(), "data": data})
+        if len(encoded) > MAX_MESSAGE:
+            subscriber.reply({"op": "error", "topic": name, "reason": "message too large"})
+            return
+        topic.seq += 1
+        topic.published += 1
+        published = time.monotonic()
+        for other in topic.subscribers:
+            if other is not subscriber:
+                other.offer(topic, encoded, published)
+
+    def stats(self):
+        return {name: topic.stats() for name, topic in self.topics.items()}
+
+    def topic_stats(self, name):
+        """
+        Stats of topic `name`, live or ended, or None if it is unknown.
+        """
+        topic = self.topics.get(name)
+        return topic.stats() if topic is not None else self.ended.get(name)
@@ -0,0 +1,144 @@
+"""
+Sample rate and channel conversion for capture tracks.
+
+Capture devices run at whatever rate and channel count they support; the
+tracks always hand aiortc 20 ms / 960-sample 48 kHz frames, which is exactly
+one Opus frame, so nothing is re-chunked downstream.
+"""
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+OPUS_RATE = 48000
+OPUS_FRAME = 960  # 20 ms at 48 kHz
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(up, down, taps_per_phase=16, beta=8.0):
+    """
+    Kaiser windowed-sinc low-pass split into `up` phases, shape (up, taps).
+
+    Row p holds the taps applied to x[i], x[i-1], ... for output samples
+    that fall on phase p of the upsampled grid. Cached per ratio, so every
+    track converting 44.1 kHz -> 48 kHz shares one filter.
+    """
+    length = taps_per_phase * up
+    n = np.arange(length) - (length - 1) / 2
+    cutoff = 0.5 / max(up, down)
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta) * up
+    return np.ascontiguousarray(h.reshape(taps_per_phase, up).T, dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def mix_matrix(in_channels, out_channels):
+    """
+    (in, out) matrix: average down to mono, duplicate mono up, fold any
+    extra inputs onto the outputs round-robin.
+    """
+    if out_channels == 1:
+        matrix = np.full((in_channels, 1), 1.0 / in_channels)
+    elif in_channels == 1:
+        matrix = np.ones((1, out_channels))
+    else:
+        matrix = np.zeros((in_channels, out_channels))
+        matrix[np.arange(in_channels), np.arange(in_channels) % out_channels] = 1.0
+        matrix /= matrix.sum(axis=0, keepdims=True)
+    matrix.setflags(write=False)
+    return matrix.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler for (samples, channels) float32 blocks.
+
+    All output samples of a block are computed with a single gather and
+    einsum; filter history is carried between blocks.
+    """
+
+    def __init__(self, in_rate, out_rate, channels, taps_per_phase=16):
+        g = gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // g
+        self.down = int(in_rate) // g
+        self.filter = polyphase_filter(self.up, self.down, taps_per_phase)
+        self.taps = self.filter.shape[1]
+        self.history = np.zeros((self.taps - 1, channels), dtype=np.float32)
+        self.consumed = 0  # input samples seen before the current block
+        self.produced = 0  # output samples emitted so far
+        self._offsets = np.arange(self.taps)
+
+    def process(self, block):
+        if self.up == self.down:
+            return block
+        n = block.shape[0]
+        last_input = self.consumed + n - 1
+        end = ((last_input + 1) * self.up - 1) // self.down + 1
+        m = np.arange(self.produced, end)
+
+        position = m * self.down
+        index = position // self.up - self.consumed + self.taps - 1
+        phase = position % self.up
+
+        ext = np.concatenate((self.history, block))
+        window = ext[index[:, None] - self._offsets[None, :]]  # (M, taps, C)
+        out = np.einsum("mkc,mk->mc", window, self.filter[phase])
+
+        self.history = ext[-(self.taps - 1):]
+        self.consumed += n
+        self.produced = end
+        return out
+
+
+class FrameChunker:
+    """
+    Collects converted samples and hands them out in fixed-size frames.
+    """
+
+    def __init__(self, channels, frame_size=OPUS_FRAME):
+        self.frame_size = frame_size
+        self.pending = np.zeros((0, channels), dtype=np.int16)
+
+    def push(self, block):
+        if self.pending.shape[0] == 0 and block.shape[0] == self.frame_size:
+            return [block]
+        data = np.concatenate((self.pending, block)) if self.pending.shape[0] else block
+        count = data.shape[0] // self.frame_size
+        frames = [data[i * self.frame_size:(i + 1) * self.frame_size] for i in range(count)]
+        self.pending = data[count * self.frame_size:].copy()
+        return frames
+
+
+class CaptureConverter:
+    """
+    Device blocks in, 960-sample 48 kHz int16 frames out.
+    """
+
+    def __init__(self, in_rate, in_channels, out_channels=1, out_rate=OPUS_RATE, frame_size=OPUS_FRAME):
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.passthrough = in_rate == out_rate and in_channels == out_channels
+        self.matrix = mix_matrix(in_channels, out_channels)
+        self.resampler = PolyphaseResampler(in_rate, out_rate, out_channels)
+        self.chunker = FrameChunker(out_channels, frame_size)
+
+    def process(self, block):
+        """
+        Convert one (samples, in_channels) int16 block into zero or more
+        (frame_size, out_channels) int16 frames.
+        """
+        if self.passthrough:
+            return self.chunker.push(np.asarray(block, dtype=np.int16))
+        data = np.asarray(block, dtype=np.float32).reshape(-1, self.in_channels)
+        if self.in_channels != self.out_channels:
+            data = data @ self.matrix
+        data = self.resampler.process(data)
+        data = np.clip(np.rint(data), -32768, 32767).astype(np.int16)
+        return self.chunker.push(data)
+
+
+def device_blocksize(samplerate, frame_size=OPUS_FRAME, out_rate=OPUS_RATE):
+    """
+    Device block size covering exactly one output frame, rounded if the
+    device rate does not divide evenly.
+    """
+    return int(round(samplerate * frame_size / out_rate))
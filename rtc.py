@@ -0,0 +1,124 @@
+"""
+Single entry point for the examples.
+
+usage: python rtc.py <command> [options]
+
+  answer-server       HTTP /offer server that records received audio (answer.py),
+                      or measures its latency (--latency FILE)
+  offer               stream a file to answer-server (offer.py)
+  mic                 stream the microphone to answer-server (mic/offer.py)
+  tone                stream a test tone (and --video test pattern, --latency
+                      markers) to answer-server
+                      (tone_generator/offer.py)
+  load                many tone callers against answer-server (tone_generator/load.py)
+  signalling-offer    offer through the signalling server (signalling/offer.py)
+  signalling-answer   answer through the signalling server (signalling/answer.py)
+
+Each command imports only its own script, so e.g. `offer` never loads
+sounddevice and `answer-server` never loads numpy. `--import-only` stops
+after the imports; benchmarks/startup.py uses it to time cold starts.
+"""
+import argparse
+import asyncio
+import importlib
+import sys
+
+
+def _load(name, args):
+    module = importlib.import_module(name)
+    if args.import_only:
+        sys.exit(0)
+    return module
+
+
+def _run_client(module):
+    try:
+        asyncio.run(module.run_client())
+    except KeyboardInterrupt:
+        print("Client stopped by user.")
+
+
+def answer_server(args):
+    answer = _load("answer", args)
+    from aiohttp import web
+
+    answer.LATENCY_RESULTS = args.latency
+    answer.admission.max_peers = args.max_peers
+
+    web.run_app(answer.app, port=args.port)
+
+
+def offer(args):
+    _run_client(_load("offer", args))
+
+
+def mic(args):
+    _run_client(_load("mic.offer", args))
+
+
+def tone(args):
+    module = _load("tone_generator.offer", args)
+    if args.video:
+        size, _, fps = args.video.partition("@")
+        width, height = size.split("x")
+        module.VIDEO = (int(width), int(height), int(fps or 30))
+    module.LATENCY_MARKERS = args.latency
+    _run_client(module)
+
+
+def load(args):
+    module = _load("tone_generator.load", args)
+    try:
+        asyncio.run(module.run_load(args.count, args.duration))
+    except KeyboardInterrupt:
+        print("Load generator stopped by user.")
+
+
+def signalling_offer(args):
+    module = _load("signalling.offer", args)
+    module.SESSION_ID = args.session_id
+    _run_client(module)
+
+
+def signalling_answer(args):
+    _load("signalling.answer", args).session_setup()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="rtc", description="WebRTC examples")
+    parser.add_argument("--import-only", action="store_true", help="import the command's modules and exit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("answer-server", help="record audio sent to POST /offer")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--max-peers", type=int, default=200, help="answer 503 beyond this many peers")
+    p.add_argument("--latency", metavar="FILE", help="measure the latency of tone --latency markers, appending results to FILE")
+    p.set_defaults(handler=answer_server)
+
+    commands.add_parser("offer", help="stream a file").set_defaults(handler=offer)
+    commands.add_parser("mic", help="stream the microphone").set_defaults(handler=mic)
+    p = commands.add_parser("tone", help="stream a test tone")
+    p.add_argument("--video", metavar="WxH[@FPS]", help="also send a test pattern, e.g. 640x480@30")
+    p.add_argument("--latency", action="store_true", help="mix in chirp markers for answer-server --latency")
+    p.set_defaults(handler=tone)
+
+    p = commands.add_parser("load", help="many synthetic callers")
+    p.add_argument("count", type=int, nargs="?", default=10)
+    p.add_argument("--duration", type=float, default=30)
+    p.set_defaults(handler=load)
+
+    p = commands.add_parser("signalling-offer", help="offer through the signalling server")
+    p.add_argument("session_id")
+    p.set_defaults(handler=signalling_offer)
+
+    commands.add_parser("signalling-answer", help="answer through the signalling server").set_defaults(handler=signalling_answer)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,27 @@
 import asyncio
-import subprocess
-from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
-from aiortc.contrib.media import MediaPlayer, MediaStreamTrack, MediaRecorder
-import aiohttp_cors
 import requests
 import time
 import traceback
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from av import AudioFrame
-import sounddevice as sd
-import numpy as np
-from queue import Queue, Empty
-import fractions
-
-class LiveAudioTrack(MediaStreamTrack):
-    """
-    A MediaStreamTrack that captures audio from the microphone
-    in real-time using sounddevice.
-    """
-
-    kind = "audio"
-
-    def __init__(self, samplerate=48000, channels=1, blocksize=512, device=None):
-        super().__init__()
-        self.samplerate = samplerate
-        self.channels = channels
-        self.blocksize = blocksize
-        self.queue = Queue()
-        self.pts = 0
-
-        if device == None:
-            device = sd.default.device[0]
-        # Open the microphone stream
-        self.stream = sd.InputStream(
-            samplerate=self.samplerate,
-            channels=self.channels,
-            blocksize=self.blocksize,
-            dtype="int16",
-            device=device,  # None = default input
-            callback=self._callback,
-        )
-        self.stream.start()
-
-    def _callback(self, indata, frames, time, status):
-        """
-        Called by sounddevice whenever a new chunk of audio is available.
-        """
-        if status:
-            print("Audio stream status:", status)
-        self.queue.put(indata.copy())
-
-    async def recv(self):
-        """
-        Return the next chunk of microphone audio as an AudioFrame.
-        """
-        # Wait for audio data to arrive
-        while True:
-            try:
-                data = self.queue.get_nowait()
-                break
-            except Empty:
-                await asyncio.sleep(0.001)
-
-        # Convert numpy buffer to AudioFrame
-        layout = "mono" if self.channels == 1 else "stereo"
-        frame = AudioFrame(format="s16", layout=layout, samples=data.shape[0])
-        frame.planes[0].update(data.tobytes())
-
-        frame.sample_rate = self.samplerate
-        frame.time_base = fractions.Fraction(1, self.samplerate)
-        frame.pts = self.pts
-        self.pts += data.shape[0]
-
-        return frame
-
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from compact_sdp import encode_sdp, decode_sdp
+from ice_restart import IceRestart
+from mic_capture import MicTrack
 
 SERVER_URL = "https://rtc-signalling-server-kkhp.vercel.app"
 SESSION_ID = None
+OPUS_SETTINGS = VOICE
+RESTART_POLL_INTERVAL = 1.0
 
 
 async def run_peer(offer_sdp):
     print("function call")
+    install_encoder_hook(OPUS_SETTINGS)
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])])) 
 
     @pc.on("datachannel")
@@ -110,7 +50,7 @@ async def run_peer(offer_sdp):
 
     # Create the answer, triggering the ICE gathering
     try:
-        mic_track = LiveAudioTrack()
+        mic_track = MicTrack()
         pc.addTrack(mic_track)
     except Exception as e:
         print("Microphone initialization failed:", e)
@@ -127,7 +67,7 @@ async def run_peer(offer_sdp):
     print("\n\n\nAnswer SDP,\n",pc.localDescription.sdp)
 
     payload = {
-        "peer1_sdp": f"{pc.localDescription.sdp}",
+        "peer1_sdp": encode_sdp(apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)),
         "peer1_beat" : int(time.time() * 1000)
     }
 
@@ -138,7 +78,37 @@ async def run_peer(offer_sdp):
     response = requests.put(f"{SERVER_URL}/api/rtc/{SESSION_ID}", json=payload, headers=headers)
 
     print("Status Code:", response.status_code)
-    await asyncio.sleep(1000)
+    await serve_restarts(pc, duration=1000)
+
+
+async def serve_restarts(pc, duration):
+    """
+    Answer ICE restarts requested by the offering peer through the session
+    record (peer2_restart -> peer1_restart) for `duration` seconds.
+    """
+    url = f"{SERVER_URL}/api/rtc/{SESSION_ID}"
+    loop = asyncio.get_running_loop()
+    handled = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline and pc.connectionState != "closed":
+        await asyncio.sleep(RESTART_POLL_INTERVAL)
+        try:
+            rtc_resp = await loop.run_in_executor(None, requests.get, url)
+            request = rtc_resp.json().get("session", {}).get("peer2_restart")
+            if not request:
+                continue
+            request = json.loads(request)
+            if request.get("seq", 0) <= handled:
+                continue
+            handled = request["seq"]
+
+            async with await IceRestart.create(pc) as ice_restart:
+                body = {"peer1_restart": json.dumps({"seq": handled, "ice": ice_restart.local_parameters()})}
+                await loop.run_in_executor(None, lambda: requests.put(url, json=body))
+                elapsed = await ice_restart.complete(request["ice"])
+            print(f"ICE restarted in {elapsed:.2f}s")
+        except Exception as e:
+            print("ICE restart failed:", e)
 
 
 def session_setup():
@@ -154,7 +124,7 @@ def session_setup():
                 rtc_resp.raise_for_status()
                 rtc_data = rtc_resp.json()
 
-                peer2_sdp = rtc_data.get("session").get("peer2_sdp", "")
+                peer2_sdp = decode_sdp(rtc_data.get("session").get("peer2_sdp", ""))
                 print(".", end="", flush=True)
                 if peer2_sdp:
                     print("\n peer2_sdp received:")
@@ -1,21 +1,33 @@
 # client.py
 import asyncio
-import aiohttp
 import json
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
-from aiortc.contrib.media import MediaPlayer, MediaStreamTrack, MediaRecorder
 import requests
 import time
 import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from compact_sdp import encode_sdp, decode_sdp
+from ice_restart import IceRestart, RestartMonitor
+from opus_recorder import recorder_for
 
 SERVER_URL = "https://rtc-signalling-server-kkhp.vercel.app"
 SESSION_ID = None
+OPUS_SETTINGS = VOICE
+RESTART_POLL_INTERVAL = 1.0
+RESTART_TIMEOUT = 15.0
+# .ogg/.webm keep the received Opus packets as is; .wav decodes every packet.
+RECORDING = "output.ogg"
+
 async def run_client():
 
+    install_encoder_hook(OPUS_SETTINGS)
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
     data_channel = pc.createDataChannel("chat")
     pc.addTransceiver("audio")
-    recorder = MediaRecorder("output.wav", format="wav")  # or "output.wav" if playback not supported
+    recorder = recorder_for(RECORDING, pc)
 
     @pc.on("track")
     async def on_track(track):
@@ -65,7 +77,7 @@ async def run_client():
     print(f"Sending offer to server at {SERVER_URL}...")
     peer2_beat = int(time.time() * 1000)
     payload = {
-        "peer2_sdp": f"{pc.localDescription.sdp}",
+        "peer2_sdp": encode_sdp(apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)),
         "peer2_beat": peer2_beat
     }
 
@@ -86,7 +98,7 @@ async def run_client():
             get_resp.raise_for_status()
             rtc_data = get_resp.json()
             
-            answer_sdp = rtc_data.get("session").get("peer1_sdp", "")
+            answer_sdp = decode_sdp(rtc_data.get("session").get("peer1_sdp", ""))
             print(".", end="", flush=True)
             # If peer1_sdp exists → stop sending updates
             if answer_sdp:
@@ -103,12 +115,41 @@ async def run_client():
             print("Error:", e)
             time.sleep(5)
 
+    # ICE restarts go through the same session record: PUT peer2_restart
+    # and poll for the peer1_restart carrying the same sequence number.
+    restart_seq = 0
+
+    async def restart_ice():
+        nonlocal restart_seq
+        restart_seq += 1
+        loop = asyncio.get_running_loop()
+        async with await IceRestart.create(pc) as ice_restart:
+            body = {"peer2_restart": json.dumps({"seq": restart_seq, "ice": ice_restart.local_parameters()})}
+            await loop.run_in_executor(None, lambda: requests.put(url, json=body, headers=headers))
+
+            deadline = time.monotonic() + RESTART_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(RESTART_POLL_INTERVAL)
+                get_resp = await loop.run_in_executor(None, requests.get, url)
+                reply = get_resp.json().get("session", {}).get("peer1_restart")
+                if reply:
+                    reply = json.loads(reply)
+                    if reply.get("seq") == restart_seq:
+                        return await ice_restart.complete(reply["ice"])
+            raise ConnectionError("No ICE restart answer from peer")
+
+    monitor = RestartMonitor(pc, restart_ice)
+    monitor.start()
+
     # Keep the connection alive to observe state changes
     print("\nConnection handshake complete. Keeping the script alive for 30 seconds.")
     print("Check the 'Connection state' messages to see the connection progress.")
     await asyncio.sleep(1000)
 
     print("\nClosing peer connection.")
+    print("ICE restart recoveries (s):", monitor.recoveries)
+    monitor.stop()
+    await recorder.stop()
     await pc.close()
 
 
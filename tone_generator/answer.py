@@ -4,6 +4,15 @@ from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
 from aiortc.contrib.media import MediaPlayer, MediaStreamTrack, MediaRecorder
 import aiohttp_cors
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+
+# How this server wants to receive Opus; senders are capped by it too.
+OPUS_SETTINGS = VOICE
+install_encoder_hook(OPUS_SETTINGS)
 
 
 async def offer(request):
@@ -73,7 +82,7 @@ async def offer(request):
 
     # print("\n\n\nAnswer SDP,\n",pc.localDescription.sdp)
 
-    return web.Response(text=pc.localDescription.sdp)
+    return web.Response(text=apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS))
 
 app = web.Application()
 
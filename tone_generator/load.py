@@ -0,0 +1,202 @@
+"""
+Load generator: many synthetic callers against answer.py from one process.
+
+All tracks come from one ToneBank, which computes every track's block in a
+single 2-D NumPy operation per tick on one shared clock, instead of one
+sleep loop and one tiny array pipeline per track.
+
+usage: python tone_generator/load.py [number of callers]
+"""
+import asyncio
+import aiohttp
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
+from aiortc.contrib.media import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from frame_pool import AudioFramePool
+from resample import OPUS_FRAME, OPUS_RATE
+
+
+class ToneBank:
+    """
+    Sine generators for `count` tracks, advanced together.
+
+    `frequencies`, `phases` and `amplitudes` are per-track arrays (or
+    scalars). Each tick computes a new `block`, an int16 array of shape
+    (count, blocksize); row i is track i's audio for that tick. A block is
+    never overwritten, so a track that resumes after the next tick has
+    already run still copies the audio that matches its pts.
+    """
+
+    def __init__(self, count, frequencies=440.0, phases=0.0, amplitudes=0.1, samplerate=OPUS_RATE, blocksize=OPUS_FRAME):
+        self.count = count
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.frequencies = np.broadcast_to(np.asarray(frequencies, dtype=np.float64), (count,)).copy()
+        self.phases = np.broadcast_to(np.asarray(phases, dtype=np.float64), (count,)).copy()
+        self.amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=np.float64), (count,)).copy()
+
+        self.block = np.zeros((count, blocksize), dtype=np.int16)
+        self._ramp = np.arange(blocksize, dtype=np.float64)
+        self._scratch = np.empty((count, blocksize), dtype=np.float64)
+
+        self.tick = -1
+        self._tick_ready = None
+        self._task = None
+        self._active = 0
+
+    def _compute(self):
+        self.block = np.empty((self.count, self.blocksize), dtype=np.int16)
+        step = 2 * np.pi * self.frequencies / self.samplerate
+        np.multiply(step[:, np.newaxis], self._ramp, out=self._scratch)
+        self._scratch += self.phases[:, np.newaxis]
+        np.sin(self._scratch, out=self._scratch)
+        self._scratch *= (self.amplitudes * 32767)[:, np.newaxis]
+        np.copyto(self.block, self._scratch, casting="unsafe")
+        self.phases = (self.phases + step * self.blocksize) % (2 * np.pi)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        period = self.blocksize / self.samplerate
+        start = loop.time()
+        while self._active:
+            self._compute()
+            self.tick += 1
+            ready, self._tick_ready = self._tick_ready, loop.create_future()
+            ready.set_result((self.tick, self.block))
+            # absolute schedule, so the clock does not drift with load
+            await asyncio.sleep(max(0.0, start + (self.tick + 1) * period - loop.time()))
+
+    async def wait_tick(self):
+        """
+        Wait for the next block; returns (tick number, block).
+        """
+        if self._task is None:
+            self._tick_ready = asyncio.get_running_loop().create_future()
+            self._task = asyncio.ensure_future(self._run())
+        return await asyncio.shield(self._tick_ready)
+
+    def track(self, index):
+        self._active += 1
+        return BankTrack(self, index)
+
+    def release(self):
+        self._active -= 1
+        if self._active == 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class BankTrack(MediaStreamTrack):
+    """
+    One row of a ToneBank as an audio track.
+    """
+
+    kind = "audio"
+
+    def __init__(self, bank, index):
+        super().__init__()
+        self.bank = bank
+        self.index = index
+        self.pool = AudioFramePool(bank.blocksize, bank.samplerate)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        tick, block = await self.bank.wait_tick()
+        # pts follows the shared clock, so a track that missed ticks shows a gap
+        frame, view = self.pool.acquire(tick * self.bank.blocksize)
+        view[:, 0] = block[self.index]
+        return frame
+
+    def stop(self):
+        if self.readyState == "live":
+            self.bank.release()
+        super().stop()
+
+
+SERVER_URL = "http://localhost:8080/offer"
+OPUS_SETTINGS = VOICE
+# Offers in flight at once; answer.py admits 8 and queues 16 more.
+OFFER_CONCURRENCY = 8
+# Attempts per caller when the server answers 429/503 with Retry-After.
+MAX_ATTEMPTS = 5
+
+
+async def post_offer(session, negotiations, payload, index):
+    """
+    POST the offer, backing off as the server's Retry-After asks. Returns
+    the answer SDP or None.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        async with negotiations:
+            async with session.post(SERVER_URL, json=payload) as response:
+                if response.status == 200:
+                    return await response.text()
+                retry_after = response.headers.get("Retry-After")
+                reason = await response.text()
+        if response.status not in (429, 503) or retry_after is None or attempt == MAX_ATTEMPTS:
+            print(f"Caller {index}: error from server after {attempt} attempt(s): {response.status} {reason}")
+            return None
+        await asyncio.sleep(float(retry_after))
+
+
+async def run_caller(session, negotiations, track, index):
+    pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
+    pc.addTrack(track)
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        if pc.connectionState == "failed":
+            print(f"Caller {index} failed")
+            track.stop()
+            await pc.close()
+
+    connected = False
+    try:
+        await pc.setLocalDescription(await pc.createOffer())
+        payload = {"offer": apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)}
+        answer_sdp = await post_offer(session, negotiations, payload, index)
+        if answer_sdp is None:
+            return None
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=answer_sdp, type="answer"))
+        connected = True
+        return pc
+    finally:
+        if not connected:
+            # closing the pc does not stop its track; give the bank row back
+            track.stop()
+            await pc.close()
+
+
+async def run_load(count, duration=30):
+    install_encoder_hook(OPUS_SETTINGS)
+    # spread callers over 200-1000 Hz so recordings are distinguishable
+    bank = ToneBank(count, frequencies=np.linspace(200, 1000, count), phases=np.random.uniform(0, 2 * np.pi, count))
+
+    started = time.time()
+    negotiations = asyncio.Semaphore(OFFER_CONCURRENCY)
+    async with aiohttp.ClientSession() as session:
+        pcs = await asyncio.gather(*(run_caller(session, negotiations, bank.track(i), i) for i in range(count)), return_exceptions=True)
+    pcs = [pc for pc in pcs if isinstance(pc, RTCPeerConnection)]
+    print(f"{len(pcs)}/{count} callers connected in {time.time() - started:.1f}s")
+
+    await asyncio.sleep(duration)
+
+    print("\nClosing peer connections.")
+    await asyncio.gather(*(pc.close() for pc in pcs))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    try:
+        asyncio.run(run_load(count))
+    except KeyboardInterrupt:
+        print("Load generator stopped by user.")
@@ -4,12 +4,17 @@ import aiohttp
 import json
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
 from aiortc.contrib.media import MediaPlayer, MediaStreamTrack
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opus_settings import VOICE, apply_to_sdp, install_encoder_hook
+from frame_pool import AudioFramePool
+from tone_generator.video import TestPatternTrack
+from latency_probe import ChirpMarkers
 
-from av import AudioFrame
-import sounddevice as sd
 import numpy as np
-from queue import Queue, Empty
-import fractions
 
 class LiveAudioTrack(MediaStreamTrack):
     kind = "audio"
@@ -21,8 +26,9 @@ class LiveAudioTrack(MediaStreamTrack):
         duration=5.0,
         samplerate=48000,
         channels=1,
-        blocksize=1024,
+        blocksize=960,  # one 20 ms Opus frame
         amplitude=0.1,
+        markers=None,
     ):
         super().__init__()
         self.start_freq = start_freq
@@ -32,12 +38,14 @@ class LiveAudioTrack(MediaStreamTrack):
         self.channels = channels
         self.blocksize = blocksize
         self.amplitude = amplitude
+        self.markers = markers  # ChirpMarkers for latency measurement
 
         # state
         self.pts = 0
         self._t = 0.0
         self._phase = 0.0
         self._forward = True  # sweep direction
+        self.pool = AudioFramePool(blocksize, samplerate, "mono" if channels == 1 else "stereo")
 
     async def recv(self):
         """
@@ -67,32 +75,34 @@ class LiveAudioTrack(MediaStreamTrack):
 
         # Generate sine wave
         samples = self.amplitude * np.sin(phase)
-
-        # Convert to int16 PCM
-        samples_int16 = np.int16(samples * 32767)
-        if self.channels == 2:
-            samples_int16 = np.repeat(samples_int16[:, np.newaxis], 2, axis=1)
-
-        # Create AudioFrame
-        layout = "mono" if self.channels == 1 else "stereo"
-        frame = AudioFrame(format="s16", layout=layout, samples=self.blocksize)
-        frame.planes[0].update(samples_int16.tobytes())
-
-        frame.sample_rate = self.samplerate
-        frame.time_base = fractions.Fraction(1, self.samplerate)
-        frame.pts = self.pts
+        if self.markers is not None:
+            # the frame counts as captured now, as it goes to the encoder
+            self.markers.mix(samples, time.time())
+
+        # Write int16 PCM straight into a pooled frame (broadcast to stereo)
+        frame, view = self.pool.acquire(self.pts)
+        samples *= 32767
+        view[:] = samples[:, np.newaxis]
         self.pts += self.blocksize
 
         return frame
 SERVER_URL = "http://localhost:8080/offer"
+OPUS_SETTINGS = VOICE
+# (width, height, fps) to also send a test pattern, e.g. (640, 480, 30)
+VIDEO = None
+# Mix chirp markers into the tone for `rtc.py answer-server --latency`
+LATENCY_MARKERS = False
 
 async def run_client():
 
+    install_encoder_hook(OPUS_SETTINGS)
     pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]))
 
     data_channel = pc.createDataChannel("chat")
-    mic_track = LiveAudioTrack()
+    mic_track = LiveAudioTrack(markers=ChirpMarkers() if LATENCY_MARKERS else None)
     pc.addTrack(mic_track)
+    if VIDEO is not None:
+        pc.addTrack(TestPatternTrack(*VIDEO))
     
     # player = MediaPlayer("default", format="pulse")
     # player = MediaPlayer("/home/shrubex/Music/music1.mp3")
@@ -132,7 +142,7 @@ async def run_client():
     print(f"Sending offer to server at {SERVER_URL}...")
     try:
         async with aiohttp.ClientSession() as session:
-            payload = {"offer": pc.localDescription.sdp}
+            payload = {"offer": apply_to_sdp(pc.localDescription.sdp, OPUS_SETTINGS)}
             async with session.post(SERVER_URL, json=payload) as response:
                 if response.status == 200:
                     answer_sdp = await response.text()
@@ -0,0 +1,152 @@
+"""
+Synthetic video: colour bars, a bouncing box and a running timestamp.
+
+TestPatternTrack renders one `cycle` of frames up front in yuv420p (the
+format aiortc's encoders take, so nothing is converted per frame). Each
+recv() copies the next frame of the cycle into a pooled VideoFrame and
+stamps the elapsed time and frame number into a small box: a memcpy and a
+few glyphs, so the encoder, not the pattern, is what a load test measures.
+"""
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiortc.contrib.media import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+from frame_pool import VideoFramePool
+
+VIDEO_CLOCK_RATE = 90000
+
+# 75% colour bars (white, yellow, cyan, green, magenta, red, blue) as BT.601 YUV
+BARS = [(180, 128, 128), (162, 44, 142), (131, 156, 44), (112, 72, 58), (84, 184, 198), (65, 100, 212), (35, 212, 114)]
+BOX = (235, 128, 128)  # white
+BLACK = (16, 128, 128)
+
+# 3x5 glyphs for the overlay
+FONT = {
+    "0": "111101101101111", "1": "010110010010111", "2": "111001111100111", "3": "111001111001111",
+    "4": "101101111001001", "5": "111100111001111", "6": "111100111101111", "7": "111001001001001",
+    "8": "111101111101111", "9": "111101111001111", ":": "000010000010000", ".": "000000000000010",
+    " ": "000000000000000", "#": "101111101111101",
+}
+
+
+def _glyphs(scale):
+    """
+    Luma bitmaps of FONT, `scale` pixels per dot, with one dot of spacing.
+    """
+    glyphs = {}
+    for char, bits in FONT.items():
+        dots = np.array([int(b) for b in bits], dtype=bool).reshape(5, 3)
+        dots = np.pad(dots, ((0, 0), (0, 1)))
+        glyphs[char] = np.where(np.kron(dots, np.ones((scale, scale), dtype=bool)), 235, 16).astype(np.uint8)
+    return glyphs
+
+
+class TestPatternTrack(MediaStreamTrack):
+    """
+    A `width` x `height` test pattern at `fps` frames per second, looping
+    over a precomputed `cycle` (seconds) of motion.
+    """
+
+    kind = "video"
+
+    def __init__(self, width=640, height=480, fps=30, cycle=2.0):
+        super().__init__()
+        if width % 2 or height % 2:
+            raise ValueError("yuv420p needs an even width and height")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_ticks = VIDEO_CLOCK_RATE // fps
+        self.pool = VideoFramePool(width, height, VIDEO_CLOCK_RATE)
+        self.scale = max(1, height // 120)
+        self.glyphs = _glyphs(self.scale)
+        self.planes = self._render(max(1, int(round(cycle * fps))))
+        self.index = 0
+        self.start = None
+
+    def _render(self, count):
+        """
+        The cycle as (y, u, v) arrays of shape (count, h, w) and
+        (count, h / 2, w / 2).
+        """
+        w, h = self.width, self.height
+        y = np.empty((count, h, w), np.uint8)
+        u = np.empty((count, h // 2, w // 2), np.uint8)
+        v = np.empty((count, h // 2, w // 2), np.uint8)
+
+        # bars on the top two thirds, a luma ramp below
+        bar = np.minimum(np.arange(w) * len(BARS) // w, len(BARS) - 1)
+        colours = np.array(BARS, np.uint8)[bar]  # (w, 3)
+        split = (2 * h // 3) & ~1
+        background = [np.empty((h, w), np.uint8), np.empty((h // 2, w // 2), np.uint8), np.empty((h // 2, w // 2), np.uint8)]
+        background[0][:split] = colours[:, 0]
+        background[1][:split // 2] = colours[::2, 1]
+        background[2][:split // 2] = colours[::2, 2]
+        ramp = np.linspace(16, 235, w).astype(np.uint8)
+
+        size = (min(w, h) // 6) & ~1
+        for i in range(count):
+            phase = i / count
+            # ramp scrolls once per cycle, so the cycle loops seamlessly
+            background[0][split:] = np.roll(ramp, int(phase * w))
+            background[1][split // 2:] = 128
+            background[2][split // 2:] = 128
+            y[i], u[i], v[i] = background
+
+            # box bounces left-right and up-down once per cycle
+            bounce = 1 - abs(2 * phase - 1)
+            x0 = int(bounce * (w - size)) & ~1
+            y0 = int((0.5 - 0.5 * np.cos(2 * np.pi * phase)) * (h - size)) & ~1
+            y[i, y0:y0 + size, x0:x0 + size] = BOX[0]
+            u[i, y0 // 2:(y0 + size) // 2, x0 // 2:(x0 + size) // 2] = BOX[1]
+            v[i, y0 // 2:(y0 + size) // 2, x0 // 2:(x0 + size) // 2] = BOX[2]
+        return y, u, v
+
+    def _stamp(self, y, u, v, text):
+        """
+        Draw `text` on a black box in the top-left corner.
+        """
+        pad = 2 * self.scale
+        cell = self.glyphs["0"].shape
+        width = min(len(text) * cell[1] + 2 * pad, self.width) & ~1
+        height = (cell[0] + 2 * pad) & ~1
+        y[:height, :width] = BLACK[0]
+        u[:height // 2, :width // 2] = BLACK[1]
+        v[:height // 2, :width // 2] = BLACK[2]
+        x = pad
+        for char in text:
+            if x + cell[1] > width:
+                break
+            y[pad:pad + cell[0], x:x + cell[1]] = self.glyphs.get(char, self.glyphs[" "])
+            x += cell[1]
+
+    def next_frame(self):
+        """
+        The next frame, without pacing.
+        """
+        position = self.index % len(self.planes[0])
+        frame, (y, u, v) = self.pool.acquire(self.index * self.frame_ticks)
+        y[:] = self.planes[0][position]
+        u[:] = self.planes[1][position]
+        v[:] = self.planes[2][position]
+
+        elapsed = self.index / self.fps
+        minutes, seconds = divmod(elapsed, 60)
+        self._stamp(y, u, v, f"{int(minutes):02d}:{seconds:06.3f} #{self.index}")
+        self.index += 1
+        return frame
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        loop = asyncio.get_running_loop()
+        if self.start is None:
+            self.start = loop.time()
+        # absolute schedule, so sleeps that overshoot do not add up
+        await asyncio.sleep(max(0.0, self.start + self.index / self.fps - loop.time()))
+        return self.next_frame()
@@ -0,0 +1,117 @@
+"""
+Energy / zero-crossing voice activity detection for capture tracks.
+"""
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """
+    Classifies int16 PCM blocks as speech or silence.
+
+    Each block is split into 10 ms sub-frames and the energy and
+    zero-crossing rate of all sub-frames are computed in one NumPy pass.
+    The noise floor drops at once to any quieter sub-frame and rises only
+    slowly, and only from blocks classed as silence, so the detector adapts
+    to the room without ever learning sustained speech as noise. A hangover
+    keeps the gate open for a while after the last speech block so word
+    endings are not clipped.
+
+    `zcr_range` is in crossings per sample; by default it spans a 70 Hz
+    fundamental (2 * 70 / samplerate) to fricatives around 8 kHz.
+    """
+
+    def __init__(
+        self,
+        samplerate=48000,
+        threshold_db=9.0,
+        min_energy_db=-60.0,
+        zcr_range=None,
+        hangover_ms=300,
+        floor_fall=0.5,
+        floor_rise=0.02,
+    ):
+        self.samplerate = samplerate
+        self.subframe = samplerate // 100
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.zcr_range = zcr_range or (2 * 70.0 / samplerate, 0.35)
+        self.floor_fall = floor_fall  # per block, towards a quieter sub-frame
+        self.floor_rise = floor_rise  # per silent block
+        self.hangover_samples = int(samplerate * hangover_ms / 1000)
+
+        self.noise_floor_db = min_energy_db
+        self._hangover = 0
+
+        # metrics
+        self.speech_blocks = 0
+        self.silent_blocks = 0
+
+    def features(self, data):
+        """
+        Return per-sub-frame energy (dBFS) and zero-crossing rate.
+        """
+        samples = np.asarray(data, dtype=np.float32)
+        mono = (samples.mean(axis=1) if samples.ndim > 1 else samples) / 32768.0
+        n = len(mono) // self.subframe
+        if n == 0:
+            frames = mono[np.newaxis, :]
+        else:
+            frames = mono[: n * self.subframe].reshape(n, self.subframe)
+        energy = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(frames.shape[1] - 1, 1)
+        return energy, zcr
+
+    def is_speech(self, data):
+        """
+        Classify one block, update the noise floor and the hangover.
+        """
+        energy, zcr = self.features(data)
+        loud = energy > max(self.noise_floor_db + self.threshold_db, self.min_energy_db)
+        low, high = self.zcr_range
+        # voiced speech has few crossings, fricatives many; broadband hiss
+        # that is only slightly above the floor sits outside the range
+        speechlike = (zcr >= low) & (zcr <= high)
+        active = bool(np.any(loud & (speechlike | (energy > self.noise_floor_db + 2 * self.threshold_db))))
+
+        quietest = max(float(np.min(energy)), self.min_energy_db)
+        if quietest < self.noise_floor_db:
+            self.noise_floor_db += self.floor_fall * (quietest - self.noise_floor_db)
+        elif not active:
+            # a louder room raises the floor over a second or so; speech,
+            # however long, never does
+            self.noise_floor_db += self.floor_rise * (quietest - self.noise_floor_db)
+
+        if active:
+            self._hangover = self.hangover_samples
+        else:
+            if self._hangover > 0:
+                self._hangover -= len(data)
+                active = True
+
+        if active:
+            self.speech_blocks += 1
+        else:
+            self.silent_blocks += 1
+        return active
+
+    @property
+    def speech_ratio(self):
+        total = self.speech_blocks + self.silent_blocks
+        return self.speech_blocks / total if total else 0.0
+
+    def stats(self):
+        return {
+            "speech_blocks": self.speech_blocks,
+            "silent_blocks": self.silent_blocks,
+            "speech_ratio": round(self.speech_ratio, 3),
+            "noise_floor_db": round(self.noise_floor_db, 1),
+        }
+
+
+def comfort_noise(shape, level_db=-70.0, rng=np.random.default_rng()):
+    """
+    Low level white noise in int16, so the far end does not hear dead air.
+    """
+    amplitude = 32768.0 * 10 ** (level_db / 20)
+    return np.int16(rng.normal(0.0, amplitude, shape))